@@ -1,8 +1,11 @@
+import os
 import streamlit as st
 import pandas as pd
 import requests
 from utils.recommender import Recommender
+from utils.posters import PosterCache
 from utils.general import load_kwargs
+from utils import metrics
 
 # Page Configuration
 st.set_page_config(
@@ -41,9 +44,19 @@ st.markdown("Discover movies that match your taste! Find recommendations by titl
 # Initialize the Recommender (you'll need to adjust these arguments based on your setup)
 @st.cache_resource
 def load_recommender():
+    # Set MRS_METRICS=1 to expose Prometheus metrics on MRS_METRICS_PORT
+    if metrics.is_enabled():
+        metrics.serve(int(os.environ.get("MRS_METRICS_PORT", 9108)))
     return Recommender.from_weaviate(**load_kwargs("config/weaviate.yaml"))
 
+
+@st.cache_resource
+def load_poster_cache():
+    return PosterCache(cache_dir="artifacts/posters")
+
 recommender = load_recommender()
+posters = load_poster_cache()
+POSTER_WIDTH = 150
 
 # Sidebar for Search Options
 st.sidebar.header("🔍 Recommendation Options")
@@ -88,6 +101,9 @@ if st.sidebar.button("Get Recommendations"):
         if recommendations is not None and not recommendations.empty:
             st.success(f"Found {len(recommendations)} similar movies!")
 
+            # Fetch all thumbnails in parallel before rendering the grid
+            poster_files = posters.prefetch(recommendations['poster_path'], width=POSTER_WIDTH)
+
             # Create columns for movie display
             cols = st.columns(3)
 
@@ -97,7 +113,11 @@ if st.sidebar.button("Get Recommendations"):
                 with col:
 
                     with st.expander(movie['movie']):
-                        st.image(Recommender.get_poster(movie.get('poster_path')), width=150)
+                        poster = poster_files.get(movie.get('poster_path'))
+                        if poster is not None:
+                            st.image(poster, width=POSTER_WIDTH)
+                        else:
+                            st.caption("No poster available")
                         st.write(f"**Release Date:** {movie.get('release_date', 'N/A')}")
                         st.write(f"**Genres:** {movie.get('genres', 'N/A')}")
                         st.write(f"**Similarity Score:** {movie.get('similarity_score', 'N/A')}")
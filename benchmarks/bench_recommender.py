@@ -0,0 +1,238 @@
+"""
+Offline latency and quality benchmark for the local recommendation paths.
+
+Builds a synthetic (or sampled real) catalog, times index construction and
+every search path, and measures recall@k of the approximate IVF index
+against exact search. Results are written as JSON for regression tracking.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_recommender --n-items 50000 --output bench.json
+    python -m benchmarks.bench_recommender --metadata data/final/final_metadata.csv \
+        --index artifacts/vector_index.npz --n-items 20000
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from utils.lexical import BM25Index
+from utils.recommender import Recommender
+from utils.vector_index import VectorIndex, IVFVectorIndex
+
+
+class HashingEmbeddings:
+    """
+    Deterministic stand-in for the sentence-transformer: every text maps to a
+    fixed pseudo-random unit vector, so query encoding cost is negligible and
+    the benchmark isolates search and assembly time.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def embed_query(self, text):
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def synthetic_catalog(n_items, dim, n_clusters=200, seed=0):
+    """
+    Clustered embeddings plus a metadata frame with the columns Recommender expects
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    cluster = rng.integers(0, n_clusters, n_items)
+    vectors = centers[cluster] + 1.5 * rng.standard_normal((n_items, dim)).astype(np.float32)
+
+    ids = rng.choice(10 * n_items, n_items, replace=False) + 1
+    directors = rng.integers(0, n_items // 20 + 1, n_items)
+    actors = rng.integers(0, n_items // 5 + 1, (n_items, 3))
+    metadata = pd.DataFrame({
+        'id': ids,
+        'title': [f"Movie {i}" for i in range(n_items)],
+        'imdb_id': [f"tt{i:07d}" for i in range(n_items)],
+        'genres': [f"Genre{c % 20}" for c in cluster],
+        'release_date': pd.Timestamp('1950-01-01') + pd.to_timedelta(rng.integers(0, 27000, n_items), unit='D'),
+        'cast': [' '.join(f"Actor{a}" for a in row) for row in actors],
+        'crew': [f"Director{d}" for d in directors],
+        'belongs_to_collection': np.where(rng.random(n_items) < 0.1, cluster.astype(str), None),
+        'budget': rng.integers(0, 200_000_000, n_items),
+        'revenue': rng.integers(0, 900_000_000, n_items),
+        'runtime': rng.integers(70, 200, n_items),
+        'original_language': 'en',
+        'popularity': rng.pareto(1.5, n_items),
+        'vote_count': rng.poisson(300, n_items),
+        'overview': '',
+        'poster_path': [f"/p{i}.jpg" for i in range(n_items)],
+        'homepage': '',
+    })
+    metadata['soup'] = ("Title: " + metadata['title'] + ". Genres: " + metadata['genres']
+                        + ". Cast: " + metadata['cast'] + ". Directors: " + metadata['crew'])
+    return metadata, vectors
+
+
+def sampled_catalog(metadata_path, index_path, n_items, seed=0):
+    index = VectorIndex.load(index_path)
+    metadata = pd.read_csv(metadata_path)
+    metadata = metadata[metadata['id'].isin(index.ids)]
+    if n_items and n_items < len(metadata):
+        metadata = metadata.sample(n_items, random_state=seed)
+    vectors = index.vectors[index.positions(metadata['id'].values)]
+    return metadata.reset_index(drop=True), vectors
+
+
+def measure_build(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {'seconds': round(seconds, 4), 'peak_memory_mb': round(peak / 2 ** 20, 2)}
+
+
+def measure_latency(fn, args_list, warmup=5):
+    for args in args_list[:warmup]:
+        fn(*args)
+    latencies = np.empty(len(args_list))
+    start = time.perf_counter()
+    for i, args in enumerate(args_list):
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies[i] = time.perf_counter() - t0
+    total = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {
+        'queries': len(args_list),
+        'qps': round(len(args_list) / total, 2),
+        'p50_ms': round(p50, 4),
+        'p95_ms': round(p95, 4),
+        'p99_ms': round(p99, 4),
+        'mean_ms': round(latencies.mean() * 1000, 4),
+    }
+
+
+def recall_at_k(exact, approx):
+    hits = [len(np.intersect1d(e, a)) / len(e) for e, a in zip(exact, approx)]
+    return round(float(np.mean(hits)), 4)
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    if args.metadata:
+        metadata, vectors = sampled_catalog(args.metadata, args.index, args.n_items, args.seed)
+    else:
+        metadata, vectors = synthetic_catalog(args.n_items, args.dim, seed=args.seed)
+    ids = metadata['id'].values
+    k = args.k
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'catalog': {
+            'source': args.metadata or 'synthetic',
+            'n_items': len(metadata),
+            'dim': int(vectors.shape[1]),
+            'vectors_mb': round(vectors.nbytes / 2 ** 20, 2),
+        },
+        'params': {'k': k, 'queries': args.queries, 'batch_samples': args.batch_samples, 'seed': args.seed},
+        'build': {},
+        'latency': {},
+        'recall': {},
+    }
+
+    index, report['build']['exact_index'] = measure_build(lambda: VectorIndex(vectors, ids))
+    _, report['build']['ivf_index'] = measure_build(lambda: IVFVectorIndex(vectors, ids, nprobe=args.nprobe[0]))
+    lexical, report['build']['bm25_index'] = measure_build(lambda: BM25Index(metadata['soup'].values))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        metadata_path = os.path.join(tmp, 'metadata.csv')
+        metadata.to_csv(metadata_path, index=False)
+        rec, report['build']['recommender'] = measure_build(
+            lambda: Recommender(None, metadata_path, index=index,
+                                embeddings=HashingEmbeddings(vectors.shape[1]), lexical_index=lexical))
+
+    sample = rng.choice(len(metadata), args.queries, replace=len(metadata) < args.queries)
+    sample_ids = [(ids[i], k) for i in sample]
+    sample_titles = [(metadata['title'].values[i], k) for i in sample]
+    keywords = [(metadata['title'].values[i], k) for i in sample[:max(1, args.queries // 10)]]
+    directors = [(metadata['crew'].values[i], k) for i in sample]
+    histories = [(list(ids[rng.choice(len(ids), args.history, replace=False)]), None, None, 'centroid', k)
+                 for _ in range(args.queries)]
+    histories_max_sim = [h[:3] + ('max_sim', k) for h in histories]
+
+    latency = report['latency']
+    latency['by_id'] = measure_latency(rec.get_recommendations_by_id, sample_ids)
+    latency['by_title'] = measure_latency(rec.get_recommendations_by_title, sample_titles)
+    latency['keyword'] = measure_latency(rec.get_recommendations_by_keywords, keywords)
+    latency['history_centroid'] = measure_latency(rec.get_recommendations_by_history, histories)
+    latency['history_max_sim'] = measure_latency(rec.get_recommendations_by_history, histories_max_sim)
+    latency['query_lexical'] = measure_latency(lambda q, k_: rec.get_recommendations_by_query(q, k_, mode='lexical'),
+                                               directors)
+    latency['query_hybrid'] = measure_latency(rec.get_recommendations_by_query, directors)
+
+    queries = vectors[sample]
+    batches = [(queries[i:i + args.batch_size], k) for i in range(0, len(queries), args.batch_size)]
+    # Cycle through the batches so the percentiles rest on enough samples
+    batches = batches * -(-args.batch_samples // len(batches))
+    batch = measure_latency(index.search, batches, warmup=1)
+    batch['batches'] = batch.pop('queries')
+    batch['queries'] = sum(len(q) for q, _ in batches)
+    batch['batch_size'] = args.batch_size
+    batch['query_qps'] = round(batch['qps'] * batch['queries'] / batch['batches'], 2)
+    latency['batch_exact'] = batch
+
+    exact_positions, _ = index.search(queries, k)
+    for nprobe in args.nprobe:
+        ivf = IVFVectorIndex(vectors, ids, nprobe=nprobe)
+        name = f'ivf_nprobe_{nprobe}'
+        latency[name] = measure_latency(ivf.search, [(q, k) for q in queries])
+        report['recall'][name] = {
+            f'recall@{k}': recall_at_k(exact_positions, ivf.search(queries, k)[0]),
+            'nlist': ivf.nlist,
+        }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n-items', type=int, default=20000, help='Catalog size (sample size with --metadata)')
+    parser.add_argument('--dim', type=int, default=384, help='Embedding size of the synthetic catalog')
+    parser.add_argument('--metadata', help='Sample a real catalog from this metadata csv')
+    parser.add_argument('--index', default='artifacts/vector_index.npz', help='Vector index saved by from_local')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--history', type=int, default=20, help='Watch history length')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batch-samples', type=int, default=200,
+                        help='Minimum number of timed batches, the query batches are repeated to reach it')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('-k', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import Counter
+
+from utils.data_downloader import SharedRateBudget
+
+
+def crawl(budget, workers, seconds):
+    """Run (category, start delay) workers against the budget, return grants per category"""
+    counts = Counter()
+    stop = time.monotonic() + seconds
+
+    def worker(category, delay):
+        time.sleep(delay)
+        while time.monotonic() < stop:
+            budget.acquire(category)
+            counts[category] += 1
+
+    threads = [threading.Thread(target=worker, args=w) for w in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def test_budget_is_shared_in_proportion_to_weights():
+    budget = SharedRateBudget(rate=400)
+    budget.register('movie', 3)
+    budget.register('tv', 1)
+    counts = crawl(budget, [('movie', 0), ('movie', 0), ('tv', 0), ('tv', 0)], seconds=0.5)
+    total = counts['movie'] + counts['tv']
+    assert total <= 400 * 0.5 + 5
+    assert 2.3 < counts['movie'] / counts['tv'] < 3.7
+
+
+def test_idle_category_does_not_bank_its_share():
+    budget = SharedRateBudget(rate=400)
+    budget.register('movie')
+    budget.register('person')
+    grants = []
+    stop = time.monotonic() + 0.5
+
+    def worker(category, delay):
+        time.sleep(delay)
+        while time.monotonic() < stop:
+            budget.acquire(category)
+            grants.append((time.monotonic(), category))
+
+    # person joins halfway through and must not get a burst for the time it was idle
+    threads = [threading.Thread(target=worker, args=w) for w in (('movie', 0), ('person', 0.25))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    joined = min(t for t, category in grants if category == 'person')
+    after = Counter(category for t, category in grants if t >= joined)
+    assert abs(after['person'] - after['movie']) <= 3
+
+
+def test_backoff_pauses_every_category():
+    budget = SharedRateBudget(rate=1000)
+    budget.register('movie')
+    budget.register('tv')
+    budget.backoff(0.3)
+    start = time.monotonic()
+    done = {}
+
+    def request(category):
+        budget.acquire(category)
+        done[category] = time.monotonic() - start
+
+    threads = [threading.Thread(target=request, args=(c,)) for c in ('movie', 'tv')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert min(done.values()) >= 0.29
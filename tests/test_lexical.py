@@ -0,0 +1,51 @@
+import numpy as np
+
+from utils.lexical import BM25Index, reciprocal_rank_fusion, tokenize, weighted_fusion
+
+SOUPS = [
+    "Title: Alien. Genres: Horror, Science Fiction. Directors: Ridley Scott.",
+    "Title: Gladiator. Genres: Action, Drama. Directors: Ridley Scott.",
+    "Title: Toy Story. Genres: Animation, Comedy. Directors: John Lasseter.",
+    "Title: Blade Runner. Genres: Science Fiction. Directors: Ridley Scott. Cast: Harrison Ford, Rutger Hauer, "
+    "Sean Young, Edward James Olmos, Daryl Hannah.",
+]
+
+
+def test_tokenize_lowercases_and_drops_punctuation():
+    assert tokenize("Ridley Scott, Sci-Fi!") == ['ridley', 'scott', 'sci', 'fi']
+
+
+def test_bm25_scores_only_documents_sharing_a_term():
+    scores = BM25Index(SOUPS).scores(["Ridley Scott", "zzzz nothing"])
+    assert scores.shape == (2, len(SOUPS))
+    assert (scores[0, [0, 1, 3]] > 0).all() and scores[0, 2] == 0
+    assert (scores[1] == 0).all()
+
+
+def test_bm25_prefers_rare_terms_and_short_documents():
+    index = BM25Index(SOUPS)
+    # 'lasseter' appears once, 'ridley' three times
+    assert index.scores(["lasseter"])[0, 2] > index.scores(["ridley"])[0, 0]
+    # same single match, the long Blade Runner soup is normalised down
+    ridley = index.scores(["ridley"])[0]
+    assert ridley[0] > ridley[3]
+
+
+def test_rrf_rewards_agreement_and_respects_exclusions():
+    vector = np.array([0.9, 0.8, 0.1, 0.7], dtype=np.float32)
+    lexical = np.array([-np.inf, 2.0, -np.inf, 1.0], dtype=np.float32)
+    fused = reciprocal_rank_fusion([vector, lexical], depth=3, k=60)
+    # doc 1 is 2nd in both rankings and beats doc 0, which is 1st in the vector ranking only
+    assert fused[1] > fused[0] > fused[2]
+    assert fused[2] == 0  # outside both top-3 lists (and -inf lexical scores never count)
+    np.testing.assert_allclose(fused[1], 1 / 62 + 1 / 61)
+
+    fused = reciprocal_rank_fusion([vector, lexical], depth=3, k=60, exclude=np.array([1]))
+    assert fused[1] == 0
+    np.testing.assert_allclose(fused[3], 1 / 62 + 1 / 61)
+
+
+def test_weighted_fusion_normalises_bm25_by_its_maximum():
+    vector = np.array([0.5, 0.2], dtype=np.float32)
+    np.testing.assert_allclose(weighted_fusion(vector, np.array([10.0, 5.0]), alpha=0.5), [0.75, 0.35])
+    np.testing.assert_allclose(weighted_fusion(vector, np.zeros(2), alpha=0.5), [0.25, 0.1])
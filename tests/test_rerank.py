@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from utils.general import MISSING
+from utils.rerank import group_codes, cap_per_group, mmr, minmax_pool, FeatureRescorer
+
+
+def test_group_codes_leave_missing_collections_ungrouped():
+    codes = group_codes(['Alien Collection', MISSING, None, np.nan, '', 'Alien Collection', 'Toy Story'])
+    assert list(codes[1:5]) == [-1, -1, -1, -1]
+    assert codes[0] == codes[5] >= 0
+    assert codes[6] >= 0 and codes[6] != codes[0]
+
+
+def test_cap_per_group_does_not_cap_movies_without_collection():
+    collections = ['A', 'A', 'A', MISSING, MISSING, MISSING, 'B', MISSING, 'B', 'B', MISSING, MISSING]
+    keep = cap_per_group(group_codes(collections), k=10, max_per_group=2)
+    assert list(keep) == [0, 1, 3, 4, 5, 6, 7, 8, 10, 11]
+
+
+def test_mmr_cap_does_not_cap_movies_without_collection():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((12, 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    relevance = np.linspace(1, 0.5, 12).astype(np.float32)
+    groups = group_codes(['A'] * 4 + [MISSING] * 8)
+    selected = mmr(relevance, vectors, k=10, lambda_=0.7, groups=groups, max_per_group=2)
+    assert len(selected) == 10
+    assert (selected < 4).sum() == 2
+
+
+def test_rescore_is_independent_of_the_score_scale():
+    metadata = pd.DataFrame({'popularity': [1, 100, 5, 50], 'vote_count': [10, 500, 20, 300],
+                             'release_date': ['2000-01-01'] * 4})
+    rescorer = FeatureRescorer(metadata, today=pd.Timestamp('2020-01-01'))
+    rows = np.arange(4)
+    cosine = np.array([0.9, 0.6, 0.5, 0.3], dtype=np.float32)
+    rrf = (cosine - 0.3) / 0.6 * 0.017 + 0.016
+    bm25 = cosine * 40
+    expected = np.argsort(-rescorer.rescore(rows, cosine))
+    assert list(np.argsort(-rescorer.rescore(rows, rrf))) == list(expected)
+    assert list(np.argsort(-rescorer.rescore(rows, bm25))) == list(expected)
+    assert expected[0] == 0
+
+
+def test_mmr_lambda_matters_for_small_fused_scores():
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((40, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    rrf = np.sort(rng.uniform(0.015, 0.033, 40))[::-1].astype(np.float32)
+    relevance = minmax_pool(rrf)
+    assert relevance.min() == 0 and relevance.max() == 1
+    picks = [list(mmr(relevance, vectors, k=10, lambda_=lambda_)) for lambda_ in (1.0, 0.8, 0.3)]
+    assert picks[0] == list(range(10))
+    assert picks[1] != picks[0] and picks[1] != picks[2]
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from utils.similarity_export import blocked_top_k, parse_size
+from utils.vector_index import VectorIndex
+
+
+def exact_top_k(vectors, rows, k):
+    """Reference: per-row exact search with the row itself excluded"""
+    index = VectorIndex(vectors, np.arange(len(vectors)))
+    positions, scores = [], []
+    for row in rows:
+        p, s = VectorIndex.top_k(index.scores(index.vectors[row])[0][None, :], k, np.array([row]))
+        positions.append(p[0])
+        scores.append(s[0])
+    return np.array(positions), np.array(scores)
+
+
+@pytest.fixture
+def vectors():
+    v = np.random.default_rng(0).standard_normal((103, 16)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize('chunk_size', [50, 7, 1000])
+def test_blocked_top_k_matches_exact_search(vectors, chunk_size):
+    # chunk_size=50 leaves a final chunk of 3 rows, 7 is smaller than k itself
+    k, start, stop = 10, 40, 60
+    positions, scores = blocked_top_k(vectors[start:stop], vectors, k, chunk_size, offset=start)
+    expected_positions, expected_scores = exact_top_k(vectors, range(start, stop), k)
+    np.testing.assert_array_equal(positions, expected_positions)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+
+def test_blocked_top_k_never_returns_the_query_itself(vectors):
+    positions, _ = blocked_top_k(vectors, vectors, 5, chunk_size=13)
+    assert not (positions == np.arange(len(vectors))[:, None]).any()
+
+
+def test_parse_size():
+    assert parse_size('48GB') == 48 * 2 ** 30
+    assert parse_size('1.5MB') == int(1.5 * 2 ** 20)
+    assert parse_size(1024) == parse_size('1024') == 1024
@@ -1,9 +1,12 @@
 import os
+import re
 import pickle
 import getpass
 import base64
+import threading
+import yaml
 from functools import wraps
-from typing import final
+from typing import Dict, Optional, final
 
 
 class FinalMeta(type):
@@ -18,7 +21,7 @@ class API_Keys(metaclass=FinalMeta):
         self.__secret_attr_00764354 = None
         self.__keys = {}
         self.__requires_pass = requires_pass
-        self.__filename = filename or os.path.join(os.getcwd(), "utils\\API_KEYS.pkl")
+        self.__filename = filename or os.path.join(os.getcwd(), "utils", "API_KEYS.pkl")
         self.__password = None  # Password will be loaded or set to default
         self.load_from_file()
         del self.__secret_attr_00764354
@@ -187,3 +190,92 @@ def fetch_api_key(platform, requires_pass=True):
 def add_api_key(platform):
     api_keys = API_Keys()
     api_keys.set_key_secretly(platform)
+
+
+class CredentialProvider:
+    """
+    Resolves API keys from environment variables or a plain YAML/JSON file
+    and caches them for the lifetime of the process.
+
+    Lookup order for platform ``weaviate2``:
+      1. the ``MRS_API_KEY_WEAVIATE2`` environment variable
+      2. the ``weaviate2`` entry of the key file (``MRS_API_KEYS_FILE``,
+         default ``config/api_keys.yaml``), read once on first use
+    """
+    ENV_PREFIX = "MRS_API_KEY_"
+    DEFAULT_FILE = os.path.join("config", "api_keys.yaml")
+
+    def __init__(self, filename=None, env_prefix=ENV_PREFIX):
+        self.filename = filename or os.environ.get("MRS_API_KEYS_FILE", self.DEFAULT_FILE)
+        self.env_prefix = env_prefix
+        self._file_keys: Optional[Dict[str, str]] = None
+        self._cache: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def env_var(self, platform):
+        return self.env_prefix + re.sub(r"[^A-Za-z0-9]", "_", platform).upper()
+
+    def _load_file(self):
+        if self._file_keys is None:
+            try:
+                with open(self.filename, "r") as file:
+                    data = yaml.safe_load(file) or {}
+            except FileNotFoundError:
+                data = {}
+            if not isinstance(data, dict):
+                raise ValueError(f"Key file '{self.filename}' must map platform names to keys")
+            # an empty entry ("tmdb:") loads as None and means the key is not set
+            self._file_keys = {str(k): str(v) for k, v in data.items() if v is not None}
+        return self._file_keys
+
+    def get(self, platform):
+        """
+        :param platform: Platform name, e.g. 'tmdb' or 'weaviate2'
+        :return: The key, or None if no source defines it
+        """
+        if platform in self._cache:
+            return self._cache[platform]
+        with self._lock:
+            key = os.environ.get(self.env_var(platform)) or self._load_file().get(platform)
+            self._cache[platform] = key
+            return key
+
+    def require(self, platform):
+        key = self.get(platform)
+        if not key:
+            raise ValueError(f"API key for {platform} not found, set {self.env_var(platform)} "
+                             f"or add it to {self.filename}")
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._file_keys = None
+
+
+_default_provider = None
+
+
+def default_credentials():
+    """
+    Process-wide CredentialProvider shared by Recommender and the downloaders
+    """
+    global _default_provider
+    if _default_provider is None:
+        _default_provider = CredentialProvider()
+    return _default_provider
+
+
+def migrate_keychain(dst=None, src=None):
+    """
+    One-off export of the keys in the legacy pickle keychain to a plain key file
+    readable by CredentialProvider. The file is created readable by its owner only.
+    """
+    api_keys = API_Keys(requires_pass=False, filename=src)
+    dst = dst or CredentialProvider.DEFAULT_FILE
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)  # also when overwriting an existing, more permissive file
+    with os.fdopen(fd, "w") as file:
+        yaml.safe_dump({platform: api_keys.get(platform) for platform in api_keys.keys()}, file)
+    print(f"Exported {len(api_keys.keys())} keys to {dst}")
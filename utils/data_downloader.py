@@ -6,33 +6,127 @@ import time
 from tqdm import tqdm
 import gzip
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from io import BytesIO
+from utils import metrics
+from utils.api_keys import default_credentials
+
+
+class SharedRateBudget:
+    """
+    Token bucket shared by several category crawlers.
+
+    Requests are granted at most ``rate`` per second overall. When several
+    categories are waiting, the next token goes to the one with the lowest
+    virtual time (weighted fair queuing), so each busy category receives a
+    share of the budget proportional to its weight, and a category that is
+    idle (e.g. parsing an ID export) leaves its share to the others.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: Requests per second across all categories
+        :param burst: Maximum number of tokens saved up while nobody is waiting
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._clock = 0.0  # virtual time of the last grant
+        self._weights: Dict[str, float] = {}
+        self._vtime: Dict[str, float] = {}
+        self._waiting: Dict[str, int] = {}
+        self._cond = threading.Condition()
+
+    def register(self, category: str, weight: float = 1.0):
+        with self._cond:
+            self._weights[category] = weight
+            self._vtime.setdefault(category, self._clock)
+            self._waiting.setdefault(category, 0)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _next_category(self) -> Optional[str]:
+        waiting = [c for c, n in self._waiting.items() if n]
+        if not waiting:
+            return None
+        return min(waiting, key=lambda c: (self._vtime[c], -self._weights[c]))
+
+    def acquire(self, category: str):
+        """
+        Block until ``category`` may send one request
+        """
+        with self._cond:
+            if category not in self._weights:
+                self.register(category)
+            if not self._waiting[category]:
+                # a category returning from idle does not get credit for the time it was away
+                self._vtime[category] = max(self._vtime[category], self._clock)
+            self._waiting[category] += 1
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1 and self._next_category() == category:
+                    self._tokens -= 1
+                    self._waiting[category] -= 1
+                    self._clock = self._vtime[category]
+                    self._vtime[category] += 1 / self._weights[category]
+                    self._cond.notify_all()
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate, 0.001)
+                self._cond.wait(min(wait, 0.5))
+
+    def backoff(self, seconds: float):
+        """
+        Stop granting tokens to every category for ``seconds`` (e.g. after HTTP 429)
+        """
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
 
 
 class TMDBDataDownloader:
     BASE_API_URL = 'https://api.themoviedb.org/3/{category}/{entry_id}'
     EXPORT_BASE_URL = 'http://files.tmdb.org/p/exports/'
+    # Daily ID export file prefix of each category, where it differs from the category name
+    EXPORT_PREFIXES = {'tv': 'tv_series'}
 
-    def __init__(self, api_key: str, categories: Tuple[str] = ('movie',)):
+    def __init__(self, api_key: Optional[str] = None, categories: Tuple[str] = ('movie',), credentials=None,
+                 priorities: Optional[Dict[str, float]] = None, requests_per_second: Optional[float] = None,
+                 output_dir: str = 'data'):
         """
         Initialize the TMDB data downloader
 
-        :param api_key: TMDB API key
+        :param api_key: TMDB API key, resolved from ``credentials`` if omitted
         :param categories: Tuple of categories to download
+        :param credentials: CredentialProvider, defaults to the process-wide one
+        :param priorities: Share of the request budget per category (default 1 each)
+        :param requests_per_second: Global request budget, defaults to ``1 / rate_limit_delay``
+        :param output_dir: Directory receiving ``{category}_data.csv`` and ``{category}_credits.csv``
         """
-        self.api_key = api_key
+        self.api_key = api_key or (credentials or default_credentials()).require('tmdb')
         self.categories = categories
+        self.output_dir = output_dir
 
         # Configuration for API calls
         self.config = {
-            'max_concurrent_requests': 1,  # Removed async parallelism
-            'rate_limit_delay': 1,  # seconds between requests
+            'max_concurrent_requests': 4,  # in-flight requests per category
+            'rate_limit_delay': 1,  # seconds between requests, also the back-off after HTTP 429
             'max_retries': 3,
             'download_batch_size': 50
         }
 
+        # One request budget shared by every category
+        self.budget = SharedRateBudget(requests_per_second or 1 / self.config['rate_limit_delay'])
+        for category in categories:
+            self.budget.register(category, (priorities or {}).get(category, 1.0))
+
         # Columns to drop from the dataset
         self.columns_to_drop: Set[str] = {
             'adult', 'backdrop_path', 'belongs_to_collection', 'profile_path', 'video'
@@ -44,32 +138,46 @@ class TMDBDataDownloader:
             'production_companies', 'spoken_languages'
         }
 
-    def fetch_with_retry(self, url: str) -> Optional[Dict]:
+    def fetch_with_retry(self, url: str, category: Optional[str] = None) -> Optional[Dict]:
         """
         Fetch data from URL with retry mechanism
 
         :param url: URL to fetch
+        :param category: Category charged for the request in the shared budget, None to bypass it
         :return: JSON response or None
         """
         for attempt in range(self.config['max_retries']):
+            if attempt:
+                metrics.inc('mrs_http_retries_total', client='tmdb')
+            if category is not None:
+                self.budget.acquire(category)
             try:
-                response = requests.get(url)
+                with metrics.span('tmdb.fetch'):
+                    response = requests.get(url)
+                metrics.inc('mrs_http_requests_total', client='tmdb', status=response.status_code)
 
                 if response.status_code == 200:
                     return response.json()
 
                 # Handle rate limiting
                 if response.status_code == 429:
-                    time.sleep(self.config['rate_limit_delay'])
+                    if category is not None:
+                        self.budget.backoff(self.config['rate_limit_delay'])
+                    else:
+                        time.sleep(self.config['rate_limit_delay'])
                 else:
                     break
 
-                time.sleep(1)  # Backoff between retries
+                if category is None:
+                    time.sleep(1)  # Backoff between retries
             except Exception as e:
+                metrics.inc('mrs_http_requests_total', client='tmdb', status='error')
                 print(f"Error fetching {url}: {e}")
 
+        metrics.inc('mrs_failures_total', stage='tmdb.fetch')
         return None
 
+    @metrics.timed('tmdb.download_ids')
     def download_category_ids(self, category: str) -> pd.DataFrame:
         """
         Download list of IDs for a specific category
@@ -79,7 +187,8 @@ class TMDBDataDownloader:
         """
         # Generate filename based on previous day's date
         yesterday = datetime.now() - timedelta(days=1)
-        filename = f'{category}_ids_{yesterday.strftime("%m_%d_%Y")}.json.gz'
+        prefix = self.EXPORT_PREFIXES.get(category, category)
+        filename = f'{prefix}_ids_{yesterday.strftime("%m_%d_%Y")}.json.gz'
 
         url = f'{self.EXPORT_BASE_URL}{filename}'
 
@@ -120,7 +229,7 @@ class TMDBDataDownloader:
         if params['append_to_response']:
             url += f'&append_to_response={params["append_to_response"]}'
 
-        return self.fetch_with_retry(url)
+        return self.fetch_with_retry(url, category)
 
     def download_entries(self, category: str, id_list: List[int]):
         """
@@ -130,26 +239,27 @@ class TMDBDataDownloader:
         :param id_list: List of entry IDs
         """
         # Remove already downloaded entries
-        if os.path.exists(f'{category}_data.csv'):
-            existing_ids = set(pd.read_csv(f'{category}_data.csv', usecols=['id'], dtype=str)['id'])
+        data_path = self.output_path(category, 'data')
+        if os.path.exists(data_path):
+            existing_ids = set(pd.read_csv(data_path, usecols=['id'], dtype=str)['id'])
             id_list = [id for id in id_list if str(id) not in existing_ids]
 
-        for i in range(0, len(id_list), self.config['download_batch_size']):
-            batch = id_list[i:i + self.config['download_batch_size']]
+        # Requests overlap on the network; the shared budget paces them
+        with ThreadPoolExecutor(max_workers=self.config['max_concurrent_requests']) as executor:
+            for i in range(0, len(id_list), self.config['download_batch_size']):
+                batch = id_list[i:i + self.config['download_batch_size']]
 
-            # Sequential downloads
-            results = []
-            for entry_id in batch:
-                result = self.fetch_entry_details(entry_id, category)
-                if result:
-                    results.append(result)
-                time.sleep(self.config['rate_limit_delay'])  # Respect rate limits
+                results = [r for r in executor.map(lambda e: self.fetch_entry_details(e, category), batch) if r]
 
-            # Process and save results
-            self.process_and_export_data(category, results)
+                # Process and save results
+                self.process_and_export_data(category, results)
 
-            print(f'Processed batch {i // self.config["download_batch_size"] + 1}')
+                print(f'[{category}] Processed batch {i // self.config["download_batch_size"] + 1}')
 
+    def output_path(self, category: str, kind: str) -> str:
+        return os.path.join(self.output_dir, f'{category}_{kind}.csv')
+
+    @metrics.timed('tmdb.export')
     def process_and_export_data(self, category: str, entries: List[Dict]):
         """
         Process and export downloaded data
@@ -176,12 +286,13 @@ class TMDBDataDownloader:
         # Special handling for movie credits
         if 'credits' in df.columns:
             credits_df = self.extract_credits(df)
-            credits_df.to_csv(f'data/{category}_credits.csv', mode='a', header=not os.path.exists(f'data/{category}_credits.csv'),
-                              index=False)
+            credits_path = self.output_path(category, 'credits')
+            credits_df.to_csv(credits_path, mode='a', header=not os.path.exists(credits_path), index=False)
             df = df.drop(columns=['credits'])
 
         # Export data
-        df.to_csv(f'data/{category}_data.csv', mode='a', header=not os.path.exists(f'data/{category}_data.csv'), index=False)
+        data_path = self.output_path(category, 'data')
+        df.to_csv(data_path, mode='a', header=not os.path.exists(data_path), index=False)
 
     def extract_credits(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -209,18 +320,40 @@ class TMDBDataDownloader:
 
         return pd.DataFrame(credits_data)
 
-    def download_all_data(self):
+    def download_category(self, category: str):
         """
-        Download data for all specified categories
+        Download the ID export and then every entry of one category
         """
-        for category in self.categories:
-            print(f'Processing category: {category}')
+        print(f'Processing category: {category}')
+
+        # Get list of IDs
+        id_df = self.download_category_ids(category)
+        id_list = id_df['id'].tolist()
+
+        # Download and process entries
+        self.download_entries(category, id_list)
+
+        print(f'Completed download for {category}')
 
-            # Get list of IDs
-            id_df = self.download_category_ids(category)
-            id_list = id_df['id'].tolist()
+    def download_all_data(self, parallel: bool = True) -> Dict[str, Optional[Exception]]:
+        """
+        Download data for all specified categories
 
-            # Download and process entries
-            self.download_entries(category, id_list)
+        :param parallel: Crawl the categories concurrently under the shared request budget
+        :return: Mapping of category to the exception that stopped it, or None on success
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
 
-            print(f'Completed download for {category}')
+        def run(category):
+            try:
+                self.download_category(category)
+                return None
+            except Exception as e:
+                metrics.inc('mrs_failures_total', stage='tmdb.download_category')
+                print(f'Download failed for {category}: {e}')
+                return e
+
+        if not parallel or not self.categories:
+            return {category: run(category) for category in self.categories}
+        with ThreadPoolExecutor(max_workers=len(self.categories)) as executor:
+            return dict(zip(self.categories, executor.map(run, self.categories)))
@@ -8,20 +8,23 @@ import time
 from typing import List, Dict, Optional, Set, Tuple
 from datetime import datetime, timedelta
 from io import BytesIO
+from utils import metrics
+from utils.api_keys import default_credentials
 
 
 class TMDBMovieDownloader:
     BASE_API_URL = 'https://api.themoviedb.org/3/movie/{entry_id}'
     EXPORT_BASE_URL = 'http://files.tmdb.org/p/exports/'
 
-    def __init__(self, api_key: str,
+    def __init__(self, api_key: Optional[str],
                  filepath: str,
                  filepath_creds: str,
                  batch_size: int = 50,
                  max_batches: int = float('inf'),
-                 max_retries: int = 3
+                 max_retries: int = 3,
+                 credentials=None
                  ):
-        self.api_key = api_key
+        self.api_key = api_key or (credentials or default_credentials()).require('tmdb')
         self.config = {
             'max_recurrent_requests': 1,
             'rate_limit_delay': 1,
@@ -34,8 +37,12 @@ class TMDBMovieDownloader:
 
     def fetch_with_retry(self, url: str):
         for attempt in range(self.config['max_retries']):
+            if attempt:
+                metrics.inc('mrs_http_retries_total', client='tmdb')
             try:
-                response = requests.get(url)
+                with metrics.span('tmdb.fetch'):
+                    response = requests.get(url)
+                metrics.inc('mrs_http_requests_total', client='tmdb', status=response.status_code)
 
                 if response.status_code == 200:
                     return response.json()
@@ -46,9 +53,12 @@ class TMDBMovieDownloader:
                     break
                 time.sleep(1)
             except Exception as e:
+                metrics.inc('mrs_http_requests_total', client='tmdb', status='error')
                 print(f"Error fetching {url}: {e}")
+        metrics.inc('mrs_failures_total', stage='tmdb.fetch')
         return None
 
+    @metrics.timed('tmdb.download_ids')
     def download__ids(self) -> pd.Series:
 
         yesterday = datetime.now() - timedelta(days=1)
@@ -97,6 +107,7 @@ class TMDBMovieDownloader:
 
         return pd.DataFrame(credits_data)
 
+    @metrics.timed('tmdb.export')
     def process_and_export(self, entries):
         if not entries:
             return
@@ -0,0 +1,252 @@
+import os
+import json
+import shutil
+import importlib.util
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+from utils import metrics
+
+
+def select_device() -> str:
+    """
+    'cuda' when a GPU is usable by PyTorch, otherwise 'cpu'.
+
+    Hosts without an NVIDIA driver answer without importing PyTorch, which
+    alone takes seconds.
+    """
+    if not (os.path.exists('/proc/driver/nvidia/version') or shutil.which('nvidia-smi')):
+        return 'cpu'
+    if importlib.util.find_spec('torch') is None:
+        return 'cpu'
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+# Default sample for the int8 parity check, shaped like the metadata soups
+PARITY_TEXTS = [
+    "Title: The Dark Knight. Genres: Action, Crime, Drama. Cast: Christian Bale, Heath Ledger. "
+    "Directors: Christopher Nolan. Overview: Batman raises the stakes in his war on crime.",
+    "Title: Toy Story. Genres: Animation, Comedy, Family. Cast: Tom Hanks, Tim Allen. Directors: John Lasseter.",
+    "Title: Amélie. Genres: Comedy, Romance. Cast: Audrey Tautou. Directors: Jean-Pierre Jeunet.",
+    "Title: Spirited Away. Genres: Animation, Family, Fantasy. Directors: Hayao Miyazaki. "
+    "Overview: A young girl wanders into a world ruled by gods, witches and spirits.",
+    "Title: Alien. Genres: Horror, Science Fiction. Cast: Sigourney Weaver. Directors: Ridley Scott.",
+    "Title: Pride & Prejudice. Genres: Drama, Romance. Cast: Keira Knightley. Directors: Joe Wright.",
+    "Title: Mad Max: Fury Road. Genres: Action, Adventure. Cast: Tom Hardy, Charlize Theron.",
+    "Title: The Godfather. Genres: Crime, Drama. Cast: Marlon Brando, Al Pacino. Directors: Francis Ford Coppola.",
+    "Title: Parasite. Genres: Comedy, Thriller, Drama. Directors: Bong Joon-ho.",
+    "Title: Up. Genres: Animation, Adventure. Overview: An old man ties balloons to his house and flies away.",
+    "Christopher Nolan",
+    "space opera with robots and a rebellion",
+    "romantic comedy set in Paris",
+    "[MISSING]",
+]
+
+
+class _TorchReference:
+    """
+    fp32 PyTorch encoder with the same pooling as OnnxEmbeddings, used as the parity reference
+    """
+
+    def __init__(self, model, tokenizer, max_length: int):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        import torch
+
+        batch = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='pt')
+        with torch.no_grad():
+            hidden = self.model(**batch)[0].numpy()
+        mask = batch['attention_mask'].numpy()[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+
+class OnnxEmbeddings:
+    """
+    CPU embedding backend running a sentence-transformers model through ONNX
+    Runtime, with int8 dynamic quantization by default.
+
+    Exposes the same ``embed_documents``/``embed_query`` interface as
+    LangChain's ``HuggingFaceEmbeddings`` (mean pooling + L2 normalisation,
+    as in all-MiniLM-L6-v2), but loads without PyTorch. The model is
+    exported once into ``cache_dir``; exporting needs ``torch`` and
+    ``transformers``, serving only ``onnxruntime`` and ``tokenizers``.
+
+    The int8 model is only served if it passed the parity check against the
+    fp32 PyTorch model at export time (recorded in ``parity.json``);
+    otherwise the fp32 ONNX model is used.
+    """
+
+    def __init__(self, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2', cache_dir: str = 'artifacts/onnx',
+                 quantize: bool = True, max_length: int = 256, batch_size: int = 64, num_threads: Optional[int] = None,
+                 parity_texts: Optional[Sequence[str]] = None, min_cosine: float = 0.98):
+        """
+        :param model_name: Hugging Face model id
+        :param cache_dir: Directory holding exported models
+        :param quantize: Serve the int8 dynamically quantized model instead of fp32, if it passes parity
+        :param max_length: Token limit per text, longer texts are truncated
+        :param batch_size: Texts encoded per ONNX Runtime call
+        :param num_threads: Intra-op threads, defaults to ONNX Runtime's choice
+        :param parity_texts: Sample texts for the export-time parity check, defaults to ``PARITY_TEXTS``
+        :param min_cosine: Minimum per-text cosine to the fp32 PyTorch model required to serve int8
+        """
+        self.model_name = model_name
+        self.model_dir = os.path.join(cache_dir, model_name.replace('/', '__'))
+        fp32_path = os.path.join(self.model_dir, 'model.onnx')
+        parity_path = os.path.join(self.model_dir, 'parity.json')
+        if not os.path.exists(fp32_path) or (quantize and not os.path.exists(parity_path)):
+            self.export(model_name, self.model_dir, quantize=quantize, parity_texts=parity_texts,
+                        min_cosine=min_cosine, max_length=max_length)
+
+        self.parity = None
+        if quantize:
+            with open(parity_path) as file:
+                self.parity = json.load(file)
+            if self.parity['min_cosine'] < min_cosine:
+                print(f"int8 model of {model_name} failed the parity check "
+                      f"(min cosine {self.parity['min_cosine']:.4f} < {min_cosine}), serving fp32 ONNX")
+        self.quantized = bool(self.parity and self.parity['min_cosine'] >= min_cosine)
+        model_path = os.path.join(self.model_dir, 'model_int8.onnx') if self.quantized else fp32_path
+        self._load(model_path, max_length, batch_size, num_threads)
+
+    def _load(self, model_path: str, max_length: int, batch_size: int, num_threads: Optional[int]):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(os.path.dirname(model_path), 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    @classmethod
+    def export(cls, model_name: str, model_dir: str, quantize: bool = True, opset: int = 14,
+               parity_texts: Optional[Sequence[str]] = None, min_cosine: float = 0.98, max_length: int = 256):
+        """
+        Export a Hugging Face encoder to ONNX (and its int8 quantized variant)
+
+        :param model_name: Hugging Face model id
+        :param model_dir: Output directory
+        :param quantize: Also write ``model_int8.onnx`` with dynamic int8 weights and
+                         record its parity with the fp32 PyTorch model in ``parity.json``
+        :param opset: ONNX opset version
+        :param parity_texts: Sample texts for the parity check, defaults to ``PARITY_TEXTS``
+        :param min_cosine: Minimum per-text cosine required for the int8 model to pass
+        :param max_length: Token limit per text in the parity check
+        """
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        os.makedirs(model_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        tokenizer.save_pretrained(model_dir)
+        model = AutoModel.from_pretrained(model_name).eval()
+
+        dummy = tokenizer(["export"], return_tensors='pt')
+        names = ['input_ids', 'attention_mask', 'token_type_ids']
+        axes = {name: {0: 'batch', 1: 'sequence'} for name in names}
+        axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+        fp32_path = os.path.join(model_dir, 'model.onnx')
+        with torch.no_grad():
+            torch.onnx.export(model, tuple(dummy[name] for name in names), fp32_path,
+                              input_names=names, output_names=['last_hidden_state'],
+                              dynamic_axes=axes, opset_version=opset)
+
+        if quantize:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            int8_path = os.path.join(model_dir, 'model_int8.onnx')
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+            # Compare against the fp32 model the stored catalog vectors were built with
+            candidate = cls.__new__(cls)
+            candidate._load(int8_path, max_length, batch_size=64, num_threads=None)
+            parity = check_parity(_TorchReference(model, tokenizer, max_length), candidate,
+                                  list(parity_texts or PARITY_TEXTS), min_cosine=min_cosine)
+            parity['min_cosine_required'] = min_cosine
+            with open(os.path.join(model_dir, 'parity.json'), 'w') as file:
+                json.dump(parity, file, indent=2)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feed = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feed = {name: value for name, value in feed.items() if name in self._input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        # Mean pooling over real tokens, then L2 normalisation
+        mask = feed['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: Sequence[str]) -> List[List[float]]:
+        # Batch texts of similar length together to minimise padding
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        vectors = [None] * len(texts)
+        with metrics.span('embeddings.onnx_encode'):
+            for start in range(0, len(texts), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                for i, vector in zip(batch, self._encode([texts[i] for i in batch])):
+                    vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        with metrics.span('embeddings.onnx_encode'):
+            return self._encode([text])[0].tolist()
+
+
+def check_parity(reference, candidate, texts: Sequence[str], min_cosine: float = 0.98) -> Dict:
+    """
+    Compare two embedding backends on the same texts
+
+    :param reference: Reference model, e.g. ``HuggingFaceEmbeddings``
+    :param candidate: Model under test, e.g. ``OnnxEmbeddings``
+    :param texts: Sample texts (a few hundred soups is plenty)
+    :param min_cosine: Minimum per-text cosine similarity required to pass
+    :return: Cosine statistics and a ``passed`` flag
+    """
+    a = np.asarray(reference.embed_documents(list(texts)), dtype=np.float32)
+    b = np.asarray(candidate.embed_documents(list(texts)), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {
+        'n_texts': len(texts),
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'passed': bool(cosine.min() >= min_cosine),
+    }
+
+
+def load_embeddings(embedding_model_args: Dict):
+    """
+    Build the embedding model described by the ``embedding_model_args`` config section
+
+    ``backend`` selects 'huggingface' (PyTorch, the default), 'onnx' (quantized CPU)
+    or 'auto' (PyTorch on GPU, ONNX otherwise). A ``device`` of 'auto' in
+    ``model_kwargs`` is resolved with ``select_device``.
+    """
+    backend = embedding_model_args.get('backend', 'huggingface')
+    model_kwargs = dict(embedding_model_args.get('model_kwargs') or {})
+    if model_kwargs.get('device') == 'auto':
+        model_kwargs['device'] = select_device()
+    if backend == 'auto':
+        backend = 'huggingface' if model_kwargs.get('device', select_device()) == 'cuda' else 'onnx'
+
+    with metrics.span(f'embeddings.load_{backend}'):
+        if backend == 'onnx':
+            return OnnxEmbeddings(model_name=embedding_model_args['model_name'],
+                                  **embedding_model_args.get('onnx_kwargs', {}))
+        if backend == 'huggingface':
+            from langchain_huggingface import HuggingFaceEmbeddings
+            return HuggingFaceEmbeddings(model_name=embedding_model_args['model_name'], model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected 'huggingface', 'onnx' or 'auto'")
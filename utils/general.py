@@ -1,5 +1,8 @@
 import yaml
 
+# Placeholder the cleaning notebook fills missing values with
+MISSING = "[MISSING]"
+
 
 def load_kwargs(fpath):
     with open(fpath, 'r') as file:
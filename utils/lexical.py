@@ -0,0 +1,110 @@
+import re
+import numpy as np
+from scipy import sparse
+from typing import Dict, List, Optional, Sequence
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the movie soups.
+
+    Per-term document weights are precomputed into a sparse (terms x docs)
+    CSR matrix, so scoring a query is a sparse row sum over its terms.
+    """
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        """
+        :param texts: One document per catalog item, in index order
+        :param k1: Term frequency saturation
+        :param b: Document length normalisation
+        """
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+
+        rows, cols = [], []
+        for doc, text in enumerate(texts):
+            for token in tokenize(text):
+                cols.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+                rows.append(doc)
+
+        n_docs = len(texts)
+        tf = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                               shape=(n_docs, len(self.vocabulary)))
+        tf.sum_duplicates()
+
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if n_docs else 0.0
+        df = np.bincount(tf.indices, minlength=len(self.vocabulary))
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # BM25 weight of every (doc, term) pair, computed on the non-zeros only
+        norm = k1 * (1 - b + b * doc_len / (avg_len or 1.0))
+        doc_of_nnz = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        tf.data = (self.idf[tf.indices] * tf.data * (k1 + 1) / (tf.data + norm[doc_of_nnz])).astype(np.float32)
+        self.weights = tf.T.tocsr()
+
+    def __len__(self):
+        return self.weights.shape[1]
+
+    def query_matrix(self, queries: Sequence[str]) -> sparse.csr_matrix:
+        rows, cols = [], []
+        for i, query in enumerate(queries):
+            for token in tokenize(query):
+                term = self.vocabulary.get(token)
+                if term is not None:
+                    rows.append(i)
+                    cols.append(term)
+        return sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                 shape=(len(queries), len(self.vocabulary)))
+
+    def scores(self, queries: Sequence[str]) -> np.ndarray:
+        """
+        BM25 scores of every document for a batch of queries
+
+        :param queries: Query strings
+        :return: Dense (q, n_docs) score matrix
+        """
+        return (self.query_matrix(queries) @ self.weights).toarray()
+
+
+def weighted_fusion(vector_scores: np.ndarray, lexical_scores: np.ndarray, alpha: float = 0.5) -> np.ndarray:
+    """
+    Convex combination of cosine scores and max-normalised BM25 scores
+
+    :param alpha: Weight of the vector scores, ``1 - alpha`` goes to BM25
+    """
+    top = lexical_scores.max(axis=-1, keepdims=True)
+    top[top <= 0] = 1.0
+    return alpha * vector_scores + (1 - alpha) * lexical_scores / top
+
+
+def reciprocal_rank_fusion(score_lists: List[np.ndarray], depth: int = 100, k: int = 60,
+                           exclude: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Reciprocal rank fusion over the top ``depth`` results of each score array
+
+    :param score_lists: 1-D score arrays over the same documents
+    :param depth: Number of top results taken from each ranking
+    :param k: RRF damping constant
+    :param exclude: Positions removed from every ranking before fusing
+    :return: Fused score per document (0 outside every top list)
+    """
+    fused = np.zeros(len(score_lists[0]), dtype=np.float32)
+    ranks = 1.0 / (k + np.arange(1, depth + 1, dtype=np.float32))
+    for scores in score_lists:
+        scores = scores.astype(np.float32, copy=True)
+        if exclude is not None and len(exclude):
+            scores[exclude] = -np.inf
+        d = min(depth, len(scores))
+        top = np.argpartition(-scores, d - 1)[:d]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        fused[top] += ranks[:len(top)]
+    return fused
@@ -0,0 +1,366 @@
+"""
+Deterministic in-process stand-in for the hosted Weaviate instance.
+
+Implements the subset of the Weaviate REST/GraphQL API used by the project
+(readiness and meta endpoints, class schema, batch object insert and
+``Get`` queries with ``nearVector`` + certainty/distance), backed by the
+local VectorIndex. Latency and failures can be injected with a seeded RNG
+so client-side batching, retries and caching can be benchmarked
+reproducibly without network access.
+
+    with LocalWeaviate(latency=0.02, failure_rate=0.05) as server:
+        server.load_catalog('Mrsprj', metadata)   # or insert via the batch API
+        rec = Recommender.from_weaviate(..., weaviate_args={**args, 'url': server.url})
+"""
+import json
+import re
+import threading
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from utils.vector_index import VectorIndex
+
+VERSION = '1.23.0'
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class _Collection:
+    def __init__(self, schema: Dict):
+        self.schema = schema
+        self.ids: List[str] = []
+        self.properties: List[Dict] = []
+        self.vectors: List[np.ndarray] = []
+        self._positions: Dict[str, int] = {}
+        self._index: Optional[VectorIndex] = None
+
+    def upsert(self, object_id: str, properties: Dict, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if object_id in self._positions:
+            pos = self._positions[object_id]
+            self.properties[pos], self.vectors[pos] = properties, vector
+        else:
+            self._positions[object_id] = len(self.ids)
+            self.ids.append(object_id)
+            self.properties.append(properties)
+            self.vectors.append(vector)
+        self._index = None
+
+    @property
+    def index(self) -> VectorIndex:
+        # rebuilt lazily after inserts, so bulk loads pay for it once
+        if self._index is None:
+            self._index = VectorIndex(np.stack(self.vectors), np.arange(len(self.ids)))
+        return self._index
+
+    def near_vector(self, vector, limit: int, certainty: Optional[float] = None,
+                    distance: Optional[float] = None):
+        if not self.ids:
+            return [], np.empty(0, dtype=np.float32)
+        positions, scores = self.index.search(np.asarray(vector, dtype=np.float32), limit)
+        positions, scores = positions[0], scores[0]
+        # Weaviate cosine distance is 1 - cos, certainty is 1 - distance / 2
+        keep = np.ones(len(scores), dtype=bool)
+        if certainty is not None:
+            keep &= (1 + scores) / 2 >= certainty
+        if distance is not None:
+            keep &= 1 - scores <= distance
+        return positions[keep], scores[keep]
+
+
+class LocalWeaviate:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 0, api_key: Optional[str] = None):
+        """
+        :param host: Interface to bind
+        :param port: Port to bind, 0 picks a free one
+        :param latency: Seconds added to every data request (schema, batch, graphql)
+        :param jitter: Standard deviation of a normal jitter added to ``latency``
+        :param failure_rate: Probability that a data request fails with HTTP 503
+        :param seed: Seed of the latency/failure RNG
+        :param api_key: If set, requests must carry ``Authorization: Bearer <api_key>``
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.api_key = api_key
+        self.classes: Dict[str, _Collection] = {}
+        self.request_counts: Dict[str, int] = {}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()  # RNG and request counts
+        # Collections are mutated and their indexes rebuilt from handler threads;
+        # writes, index rebuilds and reads all hold this lock
+        self._data_lock = threading.RLock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> 'LocalWeaviate':
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Data access, also usable without going through HTTP
+
+    def create_class(self, schema: Dict):
+        name = schema['class']
+        with self._data_lock:
+            if name in self.classes:
+                raise ValueError(f"class name {name} already exists")
+            self.classes[name] = _Collection(schema)
+
+    def insert(self, class_name: str, properties: Dict, vector, object_id: Optional[str] = None) -> str:
+        object_id = object_id or str(uuid.uuid5(uuid.NAMESPACE_URL, json.dumps(properties, sort_keys=True,
+                                                                               default=str)))
+        with self._data_lock:
+            if class_name not in self.classes:
+                self.create_class({'class': class_name, 'properties': [
+                    {'name': key, 'dataType': ['text']} for key in properties]})
+            self.classes[class_name].upsert(object_id, properties, vector)
+        return object_id
+
+    def load_catalog(self, class_name: str, metadata: pd.DataFrame, index: Optional[VectorIndex] = None,
+                     embeddings=None, text_key: str = 'movies'):
+        """
+        Load the movie catalog with the attribute names used by the modeling notebook
+
+        :param metadata: Final metadata frame (with ``soup``)
+        :param index: Vectors to load, looked up by tmdb id; embedded from the soups if omitted
+        :param embeddings: Embedding model used when ``index`` is None
+        :param text_key: Property holding the soup text
+        """
+        from utils.recommender import Recommender
+
+        if index is None:
+            index = VectorIndex.from_texts(metadata['soup'].tolist(), metadata['id'].values, embeddings)
+        frame = metadata[list(Recommender.COLUMNS)].rename(columns=Recommender.COLUMNS)
+        frame[text_key] = metadata['soup'].values
+        frame = frame.astype(object).where(frame.notna(), None)
+        vectors = index.vectors[index.positions(metadata['id'].values)]
+        for record, vector in zip(frame.to_dict('records'), vectors):
+            self.insert(class_name, record, vector, object_id=str(uuid.uuid5(uuid.NAMESPACE_URL,
+                                                                              str(record['tmdb_id']))))
+
+    # GraphQL
+
+    _GET = re.compile(r'Get\s*{\s*(\w+)\s*(?:\((.*?)\))?\s*{', re.S)
+    _NUMBER = r'([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)'
+
+    @staticmethod
+    def _selection(query: str, start: int) -> str:
+        """
+        Text of the selection set opened just before ``start``, up to its matching brace
+        """
+        depth = 1
+        for end in range(start, len(query)):
+            depth += {'{': 1, '}': -1}.get(query[end], 0)
+            if depth == 0:
+                return query[start:end]
+        raise GraphQLError('unbalanced braces in query')
+
+    def graphql(self, query: str) -> Dict:
+        with self._data_lock:
+            return self._get(query)
+
+    def _get(self, query: str) -> Dict:
+        match = self._GET.search(query)
+        if not match:
+            raise GraphQLError('only Get queries are supported by the local stand-in')
+        class_name, args = match.group(1), match.group(2) or ''
+        fields = self._selection(query, match.end())
+        if class_name not in self.classes:
+            raise GraphQLError(f'Cannot query field "{class_name}" on type "GetObjectsObj".')
+        collection = self.classes[class_name]
+
+        limit = re.search(r'limit\s*:\s*(\d+)', args)
+        limit = int(limit.group(1)) if limit else 10
+        near = re.search(r'nearVector\s*:\s*{(.*?)}', args, re.S)
+        if near:
+            vector = re.search(r'vector\s*:\s*\[([^\]]*)\]', near.group(1))
+            if not vector:
+                raise GraphQLError('nearVector requires a vector')
+            certainty = re.search(r'certainty\s*:\s*' + self._NUMBER, near.group(1))
+            distance = re.search(r'distance\s*:\s*' + self._NUMBER, near.group(1))
+            positions, scores = collection.near_vector(
+                np.array([float(v) for v in vector.group(1).split(',') if v.strip()]), limit,
+                certainty=float(certainty.group(1)) if certainty else None,
+                distance=float(distance.group(1)) if distance else None)
+        else:
+            positions = np.arange(min(limit, len(collection.ids)))
+            scores = None
+
+        additional = re.search(r'_additional\s*{([^}]*)}', fields)
+        extra = additional.group(1).split() if additional else []
+        plain = re.sub(r'_additional\s*{[^}]*}', ' ', fields).split()
+
+        objects = []
+        for i, pos in enumerate(positions):
+            props = collection.properties[pos]
+            obj = {name: props.get(name) for name in plain}
+            if extra:
+                meta = {}
+                for name in extra:
+                    if name == 'id':
+                        meta['id'] = collection.ids[pos]
+                    elif name == 'vector':
+                        meta['vector'] = collection.vectors[pos].tolist()
+                    elif name == 'distance' and scores is not None:
+                        meta['distance'] = float(1 - scores[i])
+                    elif name == 'certainty' and scores is not None:
+                        meta['certainty'] = float((1 + scores[i]) / 2)
+                    else:
+                        meta[name] = None
+                obj['_additional'] = meta
+            objects.append(obj)
+        return {'data': {'Get': {class_name: objects}}}
+
+    # HTTP plumbing
+
+    def _inject_faults(self) -> bool:
+        """
+        Sleep for the configured latency; return True if this request should fail
+        """
+        with self._lock:
+            delay = self.latency + (self._rng.normal(0, self.jitter) if self.jitter else 0.0)
+            fail = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay)
+        return fail
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body=None):
+                data = b'' if body is None else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                return json.loads(self._raw or b'null')
+
+            def _route(self, method):
+                # Drain the body first: on a kept-alive connection unread bytes
+                # would be parsed as the next request line after an early error
+                length = int(self.headers.get('Content-Length') or 0)
+                self._raw = self.rfile.read(length) if length else b''
+                path = self.path.split('?')[0].rstrip('/')
+                with server._lock:
+                    server.request_counts[path] = server.request_counts.get(path, 0) + 1
+
+                if path in ('/v1/.well-known/ready', '/v1/.well-known/live'):
+                    return self._send(200)
+                if path == '/v1/.well-known/openid-configuration':
+                    return self._send(404)
+                if server.api_key and self.headers.get('Authorization') != f'Bearer {server.api_key}':
+                    return self._send(401, {'error': [{'message': 'anonymous access not enabled'}]})
+                if path == '/v1/meta':
+                    return self._send(200, {'hostname': server.url, 'version': VERSION, 'modules': {}})
+                if path == '/v1/nodes':
+                    # read by the client's dynamic batch sizing
+                    with server._data_lock:
+                        shards = [{'class': name, 'name': 'local', 'objectCount': len(c.ids)}
+                                  for name, c in server.classes.items()]
+                    return self._send(200, {'nodes': [{
+                        'name': 'local', 'status': 'HEALTHY', 'version': VERSION, 'shards': shards,
+                        'stats': {'shardCount': len(shards), 'objectCount': sum(s['objectCount'] for s in shards)},
+                    }]})
+
+                if server._inject_faults():
+                    return self._send(503, {'error': [{'message': 'injected failure'}]})
+
+                try:
+                    return self._data_route(path, method)
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    # malformed JSON or a missing 'query', 'class' or 'vector'
+                    return self._send(422, {'error': [{'message': f'invalid request body: {e!r}'}]})
+
+            def _data_route(self, path, method):
+                if path == '/v1/graphql' and method == 'POST':
+                    try:
+                        return self._send(200, server.graphql(self._body()['query']))
+                    except GraphQLError as e:
+                        return self._send(200, {'errors': [{'message': str(e)}]})
+
+                if path == '/v1/batch/objects' and method == 'POST':
+                    results = []
+                    objects = self._body().get('objects', [])
+                    # validate the whole batch before inserting any of it
+                    missing = [key for obj in objects for key in ('class', 'vector') if key not in obj]
+                    if missing:
+                        raise KeyError(missing[0])
+                    with server._data_lock:  # a batch becomes visible to queries at once
+                        for obj in objects:
+                            object_id = server.insert(obj['class'], obj.get('properties', {}), obj['vector'],
+                                                      object_id=obj.get('id'))
+                            results.append({**obj, 'id': object_id, 'result': {}})
+                    return self._send(200, results)
+
+                if path == '/v1/schema':
+                    if method == 'GET':
+                        with server._data_lock:
+                            classes = [c.schema for c in server.classes.values()]
+                        return self._send(200, {'classes': classes})
+                    if method == 'POST':
+                        schema = self._body()
+                        try:
+                            server.create_class(schema)
+                        except ValueError as e:
+                            return self._send(422, {'error': [{'message': str(e)}]})
+                        return self._send(200, schema)
+
+                if path.startswith('/v1/schema/'):
+                    name = path.split('/')[3]
+                    with server._data_lock:
+                        collection = server.classes.get(name)
+                        if collection is not None and method == 'DELETE':
+                            del server.classes[name]
+                    if collection is None:
+                        return self._send(404)
+                    if method == 'GET':
+                        return self._send(200, collection.schema)
+                    if method == 'DELETE':
+                        return self._send(200)
+
+                return self._send(404, {'error': [{'message': f'{method} {path} is not supported'}]})
+
+            def do_GET(self):
+                self._route('GET')
+
+            def do_POST(self):
+                self._route('POST')
+
+            def do_DELETE(self):
+                self._route('DELETE')
+
+        return Handler
@@ -0,0 +1,221 @@
+"""
+Lightweight in-process metrics: counters, latency histograms and per-stage
+timing spans, exported in the Prometheus text exposition format.
+
+Collection is off unless enabled with ``enable()`` or the ``MRS_METRICS=1``
+environment variable; while disabled every helper returns after a single
+flag check.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get('MRS_METRICS', '0').lower() in ('1', 'true', 'yes')
+_NOOP = nullcontext()
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str = ''):
+        self.name = name
+        self.help = help
+        self.values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for key, value in sorted(self.values.items()):
+            yield f'{self.name}{_format_labels(key)} {value}'
+
+
+class Histogram:
+    def __init__(self, name: str, help: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self.values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_format_labels(key, (("le", le),))} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(key)} {total}'
+            yield f'{self.name}_count{_format_labels(key)} {count}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.setdefault(name, cls(name, help, **kwargs))
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric '{name}' is already registered as a {type(metric).__name__}")
+        return metric
+
+    def counter(self, name: str, help: str = '') -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(self, name: str, help: str = '', buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].collect())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self.metrics.clear()
+
+
+REGISTRY = Registry()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def inc(name: str, amount: float = 1, help: str = '', **labels):
+    """
+    Increment a counter, e.g. ``inc('mrs_cache_requests_total', cache='posters', result='hit')``
+    """
+    if _enabled:
+        REGISTRY.counter(name, help).inc(amount, **labels)
+
+
+def observe(name: str, value: float, help: str = '', **labels):
+    if _enabled:
+        REGISTRY.histogram(name, help).observe(value, **labels)
+
+
+@contextmanager
+def _span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        REGISTRY.counter('mrs_stage_failures_total', 'Stages that raised').inc(stage=stage)
+        raise
+    finally:
+        REGISTRY.histogram('mrs_stage_duration_seconds', 'Wall time per stage').observe(
+            time.perf_counter() - start, stage=stage)
+
+
+def span(stage: str):
+    """
+    Time a block of code as a named stage::
+
+        with metrics.span('recommender.vector_search'):
+            ...
+    """
+    return _span(stage) if _enabled else _NOOP
+
+
+def timed(stage: str):
+    """
+    Decorator form of ``span``
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _span(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def to_prometheus() -> str:
+    return REGISTRY.to_prometheus()
+
+
+def write_prometheus(path: str):
+    """
+    Write the current metrics for the node_exporter textfile collector
+    """
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as file:
+        file.write(to_prometheus())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = to_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 9108, addr: str = '') -> ThreadingHTTPServer:
+    """
+    Expose ``/metrics`` on a daemon thread for Prometheus to scrape
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,208 @@
+import os
+import hashlib
+import time
+import threading
+import requests
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+from utils import metrics
+from utils.general import MISSING
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, TMDB size variants are served as-is without it
+    Image = None
+
+
+class PosterCache:
+    """
+    Fetches TMDB posters at the smallest size variant that covers the
+    requested width, optionally resizes them to that exact width, and keeps
+    the thumbnails in a size-bounded on-disk cache with LRU eviction.
+
+    Cache files are addressed by the SHA-256 of (poster_path, width), fanned
+    out into 256 sub-directories. Posters TMDB does not have (HTTP 4xx) are
+    remembered in memory for ``negative_ttl`` seconds instead of being
+    requested again on every render.
+    """
+    IMAGE_BASE_URL = 'https://image.tmdb.org/t/p/{size}{poster_path}'
+    # Poster widths TMDB serves directly
+    TMDB_WIDTHS = (92, 154, 185, 342, 500, 780)
+
+    def __init__(self, cache_dir: str = 'artifacts/posters', max_bytes: int = 512 * 2 ** 20,
+                 max_workers: int = 16, timeout: float = 10, quality: int = 85, negative_ttl: float = 3600):
+        """
+        :param cache_dir: Directory holding cached thumbnails
+        :param max_bytes: Cache size above which least recently used files are evicted
+        :param max_workers: Parallel downloads in ``prefetch``
+        :param timeout: Per-request timeout in seconds
+        :param quality: JPEG quality of resized thumbnails
+        :param negative_ttl: Seconds a poster TMDB answered 4xx for is not requested again
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.quality = quality
+        self.negative_ttl = negative_ttl
+        self._misses: Dict[Tuple[str, Optional[int]], float] = {}
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    @staticmethod
+    def is_missing(poster_path) -> bool:
+        return not isinstance(poster_path, str) or poster_path.strip() in ('', MISSING)
+
+    @classmethod
+    def size_variant(cls, width: Optional[int]) -> str:
+        """
+        Smallest TMDB size variant at least ``width`` pixels wide
+        """
+        if width is None:
+            return 'original'
+        for tmdb_width in cls.TMDB_WIDTHS:
+            if tmdb_width >= width:
+                return f'w{tmdb_width}'
+        return 'original'
+
+    @classmethod
+    def url(cls, poster_path, width: Optional[int] = None) -> Optional[str]:
+        """
+        Remote URL of the size variant covering ``width``, or None if the movie has no poster
+        """
+        if cls.is_missing(poster_path):
+            return None
+        if not poster_path.startswith('/'):
+            poster_path = '/' + poster_path
+        return cls.IMAGE_BASE_URL.format(size=cls.size_variant(width), poster_path=poster_path)
+
+    def path(self, poster_path: str, width: Optional[int]) -> str:
+        digest = hashlib.sha256(f'{poster_path}:{width}'.encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}.jpg')
+
+    def get(self, poster_path, width: Optional[int] = 150) -> Optional[str]:
+        """
+        Local file of the poster thumbnail, downloading it on a cache miss
+
+        :param poster_path: TMDB ``poster_path`` of the movie
+        :param width: Target width in pixels, None for the original image
+        :return: Path to the cached image, or None if missing or the download failed
+        """
+        if self.is_missing(poster_path):
+            return None
+        path = self.path(poster_path, width)
+        if self._touch(path):
+            metrics.inc('mrs_cache_requests_total', cache='posters', result='hit')
+            return path
+
+        if self._known_missing(poster_path, width):
+            metrics.inc('mrs_cache_requests_total', cache='posters', result='negative_hit')
+            return None
+
+        metrics.inc('mrs_cache_requests_total', cache='posters', result='miss')
+        data = self._download(poster_path, width)
+        if data is None:
+            return None
+        self._store(path, data)
+        return path
+
+    def prefetch(self, poster_paths: Iterable, width: Optional[int] = 150) -> Dict[str, Optional[str]]:
+        """
+        Fetch many posters in parallel
+
+        :return: Mapping of poster_path to local file (None where unavailable)
+        """
+        unique = list(dict.fromkeys(p for p in poster_paths if not self.is_missing(p)))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            paths = executor.map(lambda p: self.get(p, width), unique)
+            return dict(zip(unique, paths))
+
+    def _download(self, poster_path: str, width: Optional[int]) -> Optional[bytes]:
+        try:
+            with metrics.span('posters.fetch'):
+                response = self.session.get(self.url(poster_path, width), timeout=self.timeout)
+            if response.status_code != 200:
+                metrics.inc('mrs_failures_total', stage='posters.fetch')
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    with self._lock:
+                        self._misses[(poster_path, width)] = time.monotonic() + self.negative_ttl
+                return None
+        except requests.RequestException as e:
+            metrics.inc('mrs_failures_total', stage='posters.fetch')
+            print(f"Error fetching poster {poster_path}: {e}")
+            return None
+        return self._resize(response.content, width)
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """
+        Mark a cached file as recently used; False if it is not cached (or was just evicted)
+        """
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _known_missing(self, poster_path: str, width: Optional[int]) -> bool:
+        with self._lock:
+            expires = self._misses.get((poster_path, width))
+            if expires is not None and expires <= time.monotonic():
+                del self._misses[(poster_path, width)]
+                expires = None
+        return expires is not None
+
+    def _resize(self, data: bytes, width: Optional[int]) -> bytes:
+        if Image is None or width is None:
+            return data
+        with metrics.span('posters.resize'):
+            image = Image.open(BytesIO(data))
+            if image.width <= width:
+                return data
+            height = round(image.height * width / image.width)
+            out = BytesIO()
+            image.convert('RGB').resize((width, height), Image.LANCZOS).save(
+                out, format='JPEG', quality=self.quality, optimize=True)
+            return out.getvalue()
+
+    def _store(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if sub.is_dir():
+                yield from (entry for entry in os.scandir(sub.path) if entry.name.endswith('.jpg'))
+
+    def _evict(self):
+        # Drop least recently used files until the cache is back under 90% of its budget
+        entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._entries()))
+        self._size = sum(size for _, size, _ in entries)
+        target = 0.9 * self.max_bytes
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+                metrics.inc('mrs_cache_evictions_total', cache='posters')
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for entry in list(self._entries()):
+                os.remove(entry.path)
+            self._size = 0
+            self._misses.clear()
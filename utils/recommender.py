@@ -1,26 +1,69 @@
+import os
 import weaviate
 from langchain.vectorstores import Weaviate
+import numpy as np
 import pandas as pd
-from langchain_huggingface import HuggingFaceEmbeddings
-from utils.api_keys import fetch_api_key
+from utils import metrics
+from utils.api_keys import default_credentials
+from utils.vector_index import VectorIndex
+from utils.lexical import BM25Index, reciprocal_rank_fusion, weighted_fusion
+from utils.rerank import mmr, minmax_pool, cap_per_group, group_codes, FeatureRescorer
+from utils.posters import PosterCache
+from utils.embeddings import load_embeddings
 
 
 class Recommender:
-    def __init__(self, vectorstore, metadata_path):
+    # metadata column -> name used in recommendation frames
+    COLUMNS = {
+        'title': 'movie',
+        'id': 'tmdb_id',
+        'imdb_id': 'imdb_id',
+        'genres': 'genres',
+        'release_date': 'release_date',
+        'cast': 'cast',
+        'crew': 'crew',
+        'belongs_to_collection': 'collection',
+        'budget': 'budget',
+        'revenue': 'revenue',
+        'runtime': 'runtime',
+        'original_language': 'language',
+        'popularity': 'popularity',
+        'overview': 'synopsis',
+        'poster_path': 'poster_path',
+        'homepage': 'homepage',
+    }
+
+    def __init__(self, vectorstore, metadata_path, index=None, embeddings=None, lexical_index=None, rescorer=None):
 
         self.vectorstore = vectorstore
         self.metadata = pd.read_csv(metadata_path)
+        self.index = index
+        self.embeddings = embeddings
+        self.lexical_index = lexical_index
+        # Optional FeatureRescorer blending similarity with popularity/recency
+        self.rescorer = rescorer
+
+        # Diversity re-ranking, disabled while both knobs are None
+        self.config = {
+            'mmr_lambda': None,  # 1.0 = pure relevance, 0.0 = pure diversity
+            'max_per_collection': None,
+            'fetch_factor': 4,  # candidate pool size is k * fetch_factor
+        }
+
+        self._collections = group_codes(self.metadata['belongs_to_collection'])
+        self._id_index = pd.Index(self.metadata['id'])
+        if index is not None:
+            # metadata row of every index position
+            self._index_rows = self._id_index.get_indexer(index.ids)
 
     @classmethod
-    def from_weaviate(cls, metadata_path, embedding_model_args, weaviate_args):
+    def from_weaviate(cls, metadata_path, embedding_model_args, weaviate_args, credentials=None, rescoring_args=None):
+        credentials = credentials or default_credentials()
         client = weaviate.Client(
             url=weaviate_args['url'],
-            auth_client_secret=weaviate.AuthApiKey(fetch_api_key(weaviate_args['ak_name'], False))
-        )
-        embeddings = HuggingFaceEmbeddings(
-            model_name=embedding_model_args['model_name'],
-            model_kwargs=embedding_model_args['model_kwargs']
+            auth_client_secret=weaviate.AuthApiKey(credentials.require(weaviate_args['ak_name']))
         )
+        embeddings = load_embeddings(embedding_model_args)
         vectorstore = Weaviate(client=client, embedding=embeddings,
                                index_name=weaviate_args['index_name'],
                                text_key=weaviate_args['text_key'],
@@ -28,62 +71,294 @@ class Recommender:
                                attributes=weaviate_args['attributes'],
                                )
         rec = cls(metadata_path=metadata_path, vectorstore=vectorstore)
+        if rescoring_args is not None:
+            rec.rescorer = FeatureRescorer(rec.metadata, **rescoring_args)
+        return rec
+
+    @classmethod
+    def from_local(cls, metadata_path, index_path, embedding_model_args, rescoring_args=None):
+        """
+        Serve recommendations from an in-process vector index instead of Weaviate.
+        The index is built from the metadata soups and saved on first use.
+        """
+        embeddings = load_embeddings(embedding_model_args)
+        if os.path.exists(index_path):
+            metrics.inc('mrs_cache_requests_total', cache='vector_index', result='hit')
+            index = VectorIndex.load(index_path)
+        else:
+            metrics.inc('mrs_cache_requests_total', cache='vector_index', result='miss')
+            metadata = pd.read_csv(metadata_path)
+            index = VectorIndex.from_texts(metadata['soup'].tolist(), metadata['id'].values, embeddings)
+            index.save(index_path)
+        rec = cls(vectorstore=None, metadata_path=metadata_path, index=index, embeddings=embeddings)
+        # BM25 over the soups, aligned with the vector index positions
+        rec.lexical_index = BM25Index(rec.metadata['soup'].fillna('').values[rec._index_rows])
+        if rescoring_args is not None:
+            rec.rescorer = FeatureRescorer(rec.metadata, **rescoring_args)
         return rec
 
     def guess_movie(self, keyword):
         return self.metadata[self.metadata['title'].str.contains(keyword)]['title'].values[0]
 
-    def get_recommendations_by_id(self, tmdb_id, k=10):
-        if tmdb_id not in self.metadata.id:
+    @metrics.timed('recommender.by_id')
+    def get_recommendations_by_id(self, tmdb_id, k=10, mode='vector', fusion='rrf', alpha=0.5):
+        if tmdb_id not in self.metadata.id.values:
             raise ValueError(f"Id '{tmdb_id}' not found in indices")
+        if mode != 'vector':
+            self._require_index()  # Weaviate serves vector search only
+        if self.index is not None:
+            return self._recommend_by_seed(tmdb_id, k, mode, fusion, alpha)
         querry = self.metadata[self.metadata['id'] == tmdb_id][['soup']].values[0]
         return self.recommend(querry[0], k)
 
-    def get_recommendations_by_title(self, title, k=10):
+    @metrics.timed('recommender.by_title')
+    def get_recommendations_by_title(self, title, k=10, mode='vector', fusion='rrf', alpha=0.5):
         if title not in list(self.metadata.title):
             raise ValueError(f"title '{title}' not found in indices")
+        if mode != 'vector':
+            self._require_index()  # Weaviate serves vector search only
+        if self.index is not None:
+            tmdb_id = self.metadata.loc[self.metadata['title'] == title, 'id'].values[0]
+            return self._recommend_by_seed(tmdb_id, k, mode, fusion, alpha)
         querry = self.metadata[self.metadata['title'] == title][['soup']].values[0]
         return self.recommend(querry[0], k)
 
+    @metrics.timed('recommender.by_query')
+    def get_recommendations_by_query(self, text, k=10, mode='hybrid', fusion='rrf', alpha=0.5):
+        """
+        Recommend from free text such as a director or actor name.
+
+        :param text: Query text
+        :param mode: 'vector', 'lexical' (BM25 over the soups) or 'hybrid'
+        :param fusion: 'rrf' (reciprocal rank) or 'weighted' score fusion for hybrid mode
+        :param alpha: Weight of the vector scores in weighted fusion
+        :return: Frame whose score column is named after the mode: 'similarity_score' (cosine),
+                 'bm25_score', 'rrf_score' or 'fused_score'
+        """
+        self._require_index()
+        vector = self._embed_query(text) if mode != 'lexical' else None
+        positions, scores = self._search(text, vector, self._fetch_k(k), mode, fusion, alpha)
+        return self._to_frame(*self._postprocess(positions, scores, k), self._score_column(mode, fusion))
+
+    def _recommend_by_seed(self, tmdb_id, k, mode, fusion, alpha):
+        if mode == 'vector':
+            return self.get_recommendations_by_history([tmdb_id], k=k)
+        seed = self.index.positions([tmdb_id])
+        text = self.metadata['soup'].values[self._index_rows[seed[0]]]
+        positions, scores = self._search(text, self.index.vectors[seed], self._fetch_k(k), mode, fusion, alpha,
+                                         exclude=seed)
+        return self._to_frame(*self._postprocess(positions, scores, k), self._score_column(mode, fusion))
+
+    def _embed_query(self, text):
+        with metrics.span('recommender.embed'):
+            return self.embeddings.embed_query(text)
+
+    def _search(self, text, vector, k, mode, fusion, alpha, exclude=None):
+        with metrics.span(f'recommender.{mode}_search'):
+            return self._search_scores(text, vector, k, mode, fusion, alpha, exclude)
+
+    def _search_scores(self, text, vector, k, mode, fusion, alpha, exclude):
+        if mode == 'vector':
+            scores = self.index.scores(vector)[0]
+        elif mode == 'lexical':
+            scores = self.lexical_index.scores([text])[0]
+            scores[scores <= 0] = -np.inf  # no query term in common
+        elif mode == 'hybrid':
+            vector_scores = self.index.scores(vector)[0]
+            lexical_scores = self.lexical_index.scores([text])[0]
+            if fusion == 'rrf':
+                lexical_scores[lexical_scores <= 0] = -np.inf
+                scores = reciprocal_rank_fusion([vector_scores, lexical_scores], depth=max(100, k),
+                                                exclude=exclude)
+            elif fusion == 'weighted':
+                scores = weighted_fusion(vector_scores, lexical_scores, alpha)
+            else:
+                raise ValueError(f"Unknown fusion '{fusion}', expected 'rrf' or 'weighted'")
+        else:
+            raise ValueError(f"Unknown mode '{mode}', expected 'vector', 'lexical' or 'hybrid'")
+        positions, scores = VectorIndex.top_k(scores[None, :], k, exclude)
+        keep = np.isfinite(scores[0])
+        return positions[0][keep], scores[0][keep]
+
+    @staticmethod
+    def _score_column(mode, fusion):
+        """
+        Frame column holding the search score: cosine, BM25 or fused scores are not comparable
+        """
+        if mode == 'lexical':
+            return 'bm25_score'
+        if mode == 'hybrid':
+            return 'rrf_score' if fusion == 'rrf' else 'fused_score'
+        return 'similarity_score'
+
+    def _require_index(self):
+        if self.index is None:
+            raise ValueError("This operation requires a local vector index, see Recommender.from_local")
+
+    @metrics.timed('recommender.by_keywords')
     def get_recommendations_by_keywords(self, keyword, k=10):
         title = self.guess_movie(keyword)
         return self.get_recommendations_by_title(title, k=k)
 
+    @metrics.timed('recommender.by_history')
+    def get_recommendations_by_history(self, tmdb_ids, weights=None, half_life=None, mode='centroid', k=10,
+                                       watched_at=None):
+        """
+        Recommend from a watch history of several seed movies in one search.
+
+        :param tmdb_ids: Watched movie ids, oldest first
+        :param weights: Optional positive per-movie weights (e.g. ratings)
+        :param half_life: If given, weights halve every ``half_life`` days before the latest
+                          ``watched_at``, or every ``half_life`` movies back in history without it
+        :param watched_at: Optional watch time of each movie (anything ``pd.to_datetime`` accepts)
+        :param mode: 'centroid' searches with the weighted mean embedding,
+                     'max_sim' scores each movie by its best match against any seed
+        :param k: Number of recommendations; already watched movies are excluded
+        """
+        self._require_index()
+        if len(tmdb_ids) == 0:
+            raise ValueError("tmdb_ids must contain at least one id")
+
+        seen = self.index.positions(tmdb_ids)
+        w = np.ones(len(seen), dtype=np.float32) if weights is None else np.asarray(weights, dtype=np.float32)
+        if len(w) != len(seen):
+            raise ValueError("weights must have one entry per id")
+        if not (np.isfinite(w) & (w > 0)).all():
+            raise ValueError("weights must be positive and finite")
+        if half_life:
+            if watched_at is not None:
+                watched_at = pd.to_datetime(pd.Series(watched_at))
+                if len(watched_at) != len(seen) or watched_at.isna().any():
+                    raise ValueError("watched_at must have one valid time per id")
+                age = ((watched_at.max() - watched_at).dt.total_seconds() / 86400).to_numpy()
+            else:
+                age = np.arange(len(seen))[::-1]
+            w = w * np.power(0.5, age / half_life).astype(np.float32)
+
+        seeds = self.index.vectors[seen]
+        fetch_k = self._fetch_k(k)
+        if mode == 'centroid':
+            with metrics.span('recommender.vector_search'):
+                positions, scores = self.index.search(w @ seeds, fetch_k, exclude=seen)
+            positions, scores = positions[0], scores[0]
+        elif mode == 'max_sim':
+            with metrics.span('recommender.max_sim_search'):
+                positions, scores = self.index.search_max_sim(seeds, fetch_k, weights=w / w.max(), exclude=seen)
+        else:
+            raise ValueError(f"Unknown mode '{mode}', expected 'centroid' or 'max_sim'")
+        return self._to_frame(*self._postprocess(positions, scores, k))
+
+    def _fetch_k(self, k):
+        if self.config['mmr_lambda'] is None and self.config['max_per_collection'] is None and self.rescorer is None:
+            return k
+        return k * self.config['fetch_factor']
+
+    def _postprocess(self, positions, scores, k):
+        """
+        Re-score an over-fetched candidate pool with popularity/recency features,
+        then re-rank it with MMR and/or a per-collection cap
+
+        :return: (positions, final scores, similarity scores) of the top k
+        """
+        similarity = scores
+        if self.rescorer is not None:
+            with metrics.span('recommender.rescore'):
+                scores = self.rescorer.rescore(self._index_rows[positions], similarity)
+                order = np.argsort(-scores, kind='stable')
+                order = order[np.isfinite(scores[order])]
+                positions, scores, similarity = positions[order], scores[order], similarity[order]
+
+        lambda_, cap = self.config['mmr_lambda'], self.config['max_per_collection']
+        if lambda_ is None and cap is None:
+            return positions[:k], scores[:k], similarity[:k]
+
+        with metrics.span('recommender.rerank'):
+            keep = self._rerank(positions, scores, k, lambda_, cap)
+        return positions[keep], scores[keep], similarity[keep]
+
+    def _rerank(self, positions, scores, k, lambda_, cap):
+        groups = self._collections[self._index_rows[positions]]
+        if lambda_ is not None:
+            # relevance on the [0, 1] scale of the cosine redundancy term, whatever the search mode
+            return mmr(minmax_pool(scores), self.index.vectors[positions], k, lambda_, groups=groups,
+                       max_per_group=cap)
+        return cap_per_group(groups, k, cap)
+
+    @metrics.timed('recommender.assemble')
+    def _to_frame(self, positions, scores, similarity, score_column='similarity_score'):
+        rows = self._index_rows[positions]
+        df = self.metadata.iloc[rows][list(self.COLUMNS)].rename(columns=self.COLUMNS)
+        df = df.reset_index(drop=True)
+        df[score_column] = np.round(similarity, 2 if score_column == 'similarity_score' else 4)
+        if self.rescorer is not None:
+            df['score'] = np.round(scores, 4)
+        return df
+
     @staticmethod
-    def get_poster(poster_path):
-        return "https://image.tmdb.org/t/p/original/" + poster_path
+    def get_poster(poster_path, width=None):
+        """
+        URL of the smallest TMDB poster variant covering ``width`` pixels
+        (the original image if None), or None if the movie has no poster.
+        """
+        return PosterCache.url(poster_path, width)
 
+    @metrics.timed('recommender.recommend')
     def recommend(self, query, k):
+        if self.index is not None:
+            vector = self._embed_query(query)
+            with metrics.span('recommender.vector_search'):
+                positions, scores = self.index.search(vector, self._fetch_k(k) + 1)
+            return self._to_frame(*self._postprocess(positions[0, 1:], scores[0, 1:], k))
         try:
-            results = self.vectorstore.similarity_search_with_score(query, k=k + 1)
-
-            top_k = []
-
-            for x in results[1:]:
-                movie_metadata = {
-                    'movie': x[0].metadata['movie'],
-                    "tmdb_id": x[0].metadata['tmdb_id'],
-                    "imdb_id": x[0].metadata['imdb_id'],
-                    'genres': x[0].metadata['genres'],
-                    "release_date": x[0].metadata['release_date'],
-                    "cast": x[0].metadata['cast'],
-                    "crew": x[0].metadata['crew'],
-                    "collection": x[0].metadata['collection'],
-                    "budget": x[0].metadata['budget'],
-                    "revenue": x[0].metadata['revenue'],
-                    "runtime": x[0].metadata['runtime'],
-                    "language": x[0].metadata['language'],
-                    "popularity": x[0].metadata['popularity'],
-                    "synopsis": x[0].metadata['synopsis'],
-                    "poster_path": x[0].metadata['poster_path'],
-                    "homepage": x[0].metadata['homepage'],
-                    'similarity_score': round(x[1], 2),
-                }
-                top_k.append(movie_metadata)
-
-            df_top_k = pd.DataFrame(top_k)
-            return df_top_k
+            # embeds the query and calls Weaviate over the network
+            with metrics.span('recommender.weaviate_search'):
+                results = self.vectorstore.similarity_search_with_score(query, k=self._fetch_k(k) + 1)
+            return self._frame_from_documents(results[1:], k)
 
         except Exception as e:
+            metrics.inc('mrs_failures_total', stage='recommender.recommend')
             print(f"Error during query: {e}")
             return None
+
+    @metrics.timed('recommender.assemble')
+    def _frame_from_documents(self, results, k):
+        top_k = []
+
+        for x in results:
+            movie_metadata = {
+                'movie': x[0].metadata['movie'],
+                "tmdb_id": x[0].metadata['tmdb_id'],
+                "imdb_id": x[0].metadata['imdb_id'],
+                'genres': x[0].metadata['genres'],
+                "release_date": x[0].metadata['release_date'],
+                "cast": x[0].metadata['cast'],
+                "crew": x[0].metadata['crew'],
+                "collection": x[0].metadata['collection'],
+                "budget": x[0].metadata['budget'],
+                "revenue": x[0].metadata['revenue'],
+                "runtime": x[0].metadata['runtime'],
+                "language": x[0].metadata['language'],
+                "popularity": x[0].metadata['popularity'],
+                "synopsis": x[0].metadata['synopsis'],
+                "poster_path": x[0].metadata['poster_path'],
+                "homepage": x[0].metadata['homepage'],
+                'similarity_score': round(x[1], 2),
+            }
+            top_k.append(movie_metadata)
+
+        df_top_k = pd.DataFrame(top_k)
+        if self.rescorer is not None and len(df_top_k):
+            similarity = np.array([x[1] for x in results], dtype=np.float32)
+            rows = self._id_index.get_indexer(df_top_k['tmdb_id'])
+            known = rows >= 0
+            scores = similarity.copy()
+            scores[known] = self.rescorer.rescore(rows[known], similarity[known])
+            df_top_k['score'] = np.round(scores, 4)
+            order = np.argsort(-scores, kind='stable')
+            df_top_k = df_top_k.iloc[order[np.isfinite(scores[order])]]
+        # Weaviate returns no vectors, so only the collection cap applies here
+        if self.config['max_per_collection'] is not None and len(df_top_k):
+            groups = group_codes(df_top_k['collection'])
+            df_top_k = df_top_k.iloc[cap_per_group(groups, k, self.config['max_per_collection'])]
+        df_top_k = df_top_k.head(k).reset_index(drop=True)
+        return df_top_k
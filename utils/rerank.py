@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+from typing import Optional
+from utils.general import MISSING
+
+
+def group_codes(values) -> np.ndarray:
+    """
+    Integer group code per value (e.g. collection names), -1 for NaN, empty and ``MISSING``
+    """
+    values = pd.Series(values, dtype=object)
+    ungrouped = values.isna() | values.astype(str).str.strip().isin(['', MISSING])
+    return pd.factorize(values.where(~ungrouped))[0]
+
+
+def mmr(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_: float = 0.7,
+        groups: Optional[np.ndarray] = None, max_per_group: Optional[int] = None) -> np.ndarray:
+    """
+    Maximal Marginal Relevance selection over a candidate pool.
+
+    The candidate-candidate similarity matrix is computed once; each greedy
+    step is then a handful of vector operations over the pool.
+
+    :param relevance: (c,) relevance of each candidate to the query, on a scale comparable
+                      with cosine similarity (see ``minmax_pool``)
+    :param vectors: (c, d) L2-normalised candidate embeddings
+    :param k: Number of candidates to select
+    :param lambda_: Trade-off between relevance (1.0) and diversity (0.0)
+    :param groups: Optional (c,) integer group codes (e.g. collections), -1 for ungrouped
+    :param max_per_group: Maximum number of selected candidates sharing a group
+    :return: Selected candidate positions, in selection order
+    """
+    n = len(relevance)
+    k = min(k, n)
+    similarity = vectors @ vectors.T
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    group_counts = {}
+    selected = []
+
+    for _ in range(k):
+        if selected:
+            score = lambda_ * relevance - (1 - lambda_) * redundancy
+        else:
+            score = relevance.astype(np.float32, copy=True)
+        score = np.where(available, score, -np.inf)
+        pick = int(np.argmax(score))
+        if not np.isfinite(score[pick]):
+            break
+
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+
+        if max_per_group is not None and groups is not None and groups[pick] >= 0:
+            group = groups[pick]
+            group_counts[group] = group_counts.get(group, 0) + 1
+            if group_counts[group] >= max_per_group:
+                available &= groups != group
+
+    return np.array(selected, dtype=np.int64)
+
+
+def minmax_pool(scores: np.ndarray) -> np.ndarray:
+    """
+    Min-max normalise the scores of a candidate pool to [0, 1]
+
+    Makes cosine, BM25 and fused RRF scores comparable with fixed-scale terms.
+    Non-finite scores stay -inf; a pool of equal scores maps to 1.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    finite = np.isfinite(scores)
+    out = np.full(len(scores), -np.inf, dtype=np.float32)
+    if finite.any():
+        low, high = scores[finite].min(), scores[finite].max()
+        out[finite] = (scores[finite] - low) / (high - low) if high > low else 1.0
+    return out
+
+
+def cap_per_group(groups: np.ndarray, k: int, max_per_group: int) -> np.ndarray:
+    """
+    Keep candidates in rank order, dropping those whose group is already full
+
+    :param groups: (c,) integer group codes in rank order, -1 for ungrouped
+    :param k: Number of candidates to keep
+    :param max_per_group: Maximum number of kept candidates sharing a group
+    :return: Kept candidate positions
+    """
+    groups = np.asarray(groups)
+    order = np.zeros(len(groups), dtype=np.int64)
+    grouped = groups >= 0
+    if grouped.any():
+        codes = groups[grouped]
+        # occurrence number of each candidate within its group, in rank order
+        sort = np.argsort(codes, kind='stable')
+        starts = np.r_[0, np.flatnonzero(np.diff(codes[sort])) + 1]
+        run = np.arange(len(codes)) - np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+        occurrence = np.empty(len(codes), dtype=np.int64)
+        occurrence[sort] = run
+        order[grouped] = occurrence
+    return np.flatnonzero(order < max_per_group)[:k]
+
+
+class FeatureRescorer:
+    """
+    Blends similarity with precomputed popularity, vote count and recency
+    features. Features are normalised once per catalog, so re-scoring a
+    candidate set is a single gather plus a small matrix-vector product.
+
+    Similarity is min-max normalised over the candidate pool before blending,
+    so the feature weights mean the same for cosine, BM25 and RRF scores.
+    """
+
+    def __init__(self, metadata: pd.DataFrame, similarity: float = 1.0, popularity: float = 0.1,
+                 votes: float = 0.05, recency: float = 0.05, half_life_years: float = 10.0,
+                 min_vote_count: int = 0, drop_unreleased: bool = True, today: Optional[pd.Timestamp] = None):
+        """
+        :param metadata: Catalog metadata, rows are addressed by position
+        :param similarity: Weight of the similarity score
+        :param popularity: Weight of log-scaled, min-max normalised ``popularity``
+        :param votes: Weight of log-scaled, min-max normalised ``vote_count``
+        :param recency: Weight of ``0.5 ** (age / half_life_years)`` from ``release_date``
+        :param half_life_years: Age at which the recency feature halves
+        :param min_vote_count: Movies with fewer votes are never returned
+        :param drop_unreleased: Never return movies released after ``today``
+        :param today: Reference date, defaults to now
+        """
+        n = len(metadata)
+        today = today or pd.Timestamp.now()
+        release = pd.to_datetime(metadata['release_date'], errors='coerce') if 'release_date' in metadata else \
+            pd.Series(pd.NaT, index=metadata.index)
+        age_years = ((today - release).dt.days / 365.25).to_numpy(dtype=np.float64, na_value=np.nan)
+
+        vote_count = self._column(metadata, 'vote_count', n)
+        features = [
+            self._minmax(np.log1p(np.clip(self._column(metadata, 'popularity', n), 0, None))),
+            self._minmax(np.log1p(np.clip(vote_count, 0, None))),
+            np.where(np.isnan(age_years), 0.0, np.power(0.5, np.clip(age_years, 0, None) / half_life_years)),
+        ]
+        self.similarity_weight = similarity
+        self.features = np.stack(features, axis=1).astype(np.float32)
+        self.weights = np.array([popularity, votes, recency], dtype=np.float32)
+
+        excluded = np.zeros(n, dtype=bool)
+        if drop_unreleased:
+            excluded |= age_years < 0
+        if min_vote_count and 'vote_count' in metadata:
+            excluded |= vote_count < min_vote_count
+        self.penalty = np.where(excluded, -np.inf, 0.0).astype(np.float32)
+
+    @staticmethod
+    def _column(metadata: pd.DataFrame, name: str, n: int) -> np.ndarray:
+        if name not in metadata:
+            return np.zeros(n)
+        return pd.to_numeric(metadata[name], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+    @staticmethod
+    def _minmax(values: np.ndarray) -> np.ndarray:
+        span = values.max() - values.min() if len(values) else 0
+        return (values - values.min()) / span if span > 0 else np.zeros_like(values)
+
+    def rescore(self, rows: np.ndarray, similarity: np.ndarray) -> np.ndarray:
+        """
+        :param rows: Metadata row of each candidate
+        :param similarity: Similarity score of each candidate, on any scale
+        :return: Blended scores, -inf for excluded candidates
+        """
+        return (self.similarity_weight * minmax_pool(similarity)
+                + self.features[rows] @ self.weights + self.penalty[rows])
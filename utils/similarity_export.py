@@ -0,0 +1,304 @@
+"""
+Catalog-wide "movie -> top k similar movies" export.
+
+The embedding matrix is memory-mapped and processed in row blocks by a pool
+of worker processes. Each worker scores its block against the catalog one
+column chunk at a time and keeps a running top-k, so its memory is bounded
+by the block and chunk sizes rather than the catalog size. Every finished
+block is written as its own Parquet part, which makes the job resumable:
+rerunning it skips parts that already exist.
+
+Usage (from the repository root):
+    python -m utils.similarity_export --index artifacts/vector_index.npz \
+        --output data/similar_movies --k 50 --workers 32 --memory-limit 48GB
+"""
+import argparse
+import json
+import os
+import shutil
+import hashlib
+import zipfile
+import multiprocessing as mp
+import numpy as np
+from tqdm import tqdm
+from typing import Optional, Tuple
+from utils import metrics
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed when writing parts
+    pa = pq = None
+
+# Worker process state, set by _init_worker
+_vectors = None
+_ids = None
+
+
+def parse_size(size) -> int:
+    """
+    '48GB', '512MB' or a plain number of bytes
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    units = {'KB': 2 ** 10, 'MB': 2 ** 20, 'GB': 2 ** 30, 'TB': 2 ** 40}
+    size = size.strip().upper()
+    for unit, factor in units.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * factor)
+    return int(size)
+
+
+def _init_worker(vectors_path, ids_path):
+    global _vectors, _ids
+    _vectors = np.load(vectors_path, mmap_mode='r')
+    _ids = np.load(ids_path, mmap_mode='r')
+
+
+def blocked_top_k(queries: np.ndarray, vectors: np.ndarray, k: int, chunk_size: int,
+                  offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k inner products of ``queries`` against ``vectors``, scanning
+    ``vectors`` in chunks and skipping each query's own row
+
+    :param queries: (b, d) normalised query rows
+    :param vectors: (n, d) normalised catalog, may be a memmap
+    :param k: Neighbours per query
+    :param chunk_size: Catalog rows scored at once
+    :param offset: Catalog row of ``queries[0]``, used to exclude self matches
+    :return: (positions, scores) of shape (b, k), best first
+    """
+    b = len(queries)
+    best_pos = np.full((b, k), -1, dtype=np.int64)
+    best_scores = np.full((b, k), -np.inf, dtype=np.float32)
+    own = np.arange(offset, offset + b)
+
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size])
+        scores = queries @ chunk.T
+
+        # mask self similarity where this chunk overlaps the query block
+        rows = np.flatnonzero((own >= start) & (own < start + len(chunk)))
+        scores[rows, own[rows] - start] = -np.inf
+
+        kk = min(k, scores.shape[1])
+        part = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+        cand_scores = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+        cand_pos = np.concatenate([best_pos, part + start], axis=1)
+        keep = np.argpartition(-cand_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(cand_scores, keep, axis=1)
+        best_pos = np.take_along_axis(cand_pos, keep, axis=1)
+
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_pos, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _export_block(task):
+    block, start, stop, k, chunk_size, path = task
+    queries = np.asarray(_vectors[start:stop])
+    positions, scores = blocked_top_k(queries, _vectors, k, chunk_size, offset=start)
+
+    valid = np.isfinite(scores)
+    rows, ranks = np.nonzero(valid)
+    table = pa.table({
+        'movie_id': pa.array(np.asarray(_ids[start:stop])[rows]),
+        'rank': pa.array((ranks + 1).astype(np.int16)),
+        'similar_id': pa.array(np.asarray(_ids)[positions[valid]]),
+        'score': pa.array(scores[valid].astype(np.float32)),
+    })
+    tmp = f'{path}.tmp'
+    pq.write_table(table, tmp, compression='zstd')
+    os.replace(tmp, path)
+    return block
+
+
+class SimilarityExporter:
+    def __init__(self, output_dir: str, k: int = 50, workers: Optional[int] = None,
+                 memory_limit='8GB', block_size: Optional[int] = None, chunk_size: Optional[int] = None,
+                 worker_overhead='100MB'):
+        """
+        :param output_dir: Directory receiving the Parquet parts and the manifest
+        :param k: Similar movies per movie
+        :param workers: Worker processes, defaults to the CPU count
+        :param memory_limit: Cap on the combined working memory of all workers
+                             (the memory-mapped matrix itself lives in the page cache).
+                             The parent adds the ids and one 65536-row block while
+                             preparing, plus whatever ``vectors`` passed to ``run`` occupy;
+                             pass a memmap to keep that out of RAM.
+        :param block_size: Query rows per part, derived from the memory limit if omitted
+        :param chunk_size: Catalog rows scored at once, derived from the memory limit if omitted
+        :param worker_overhead: Baseline resident memory of one worker process before it
+                                touches any data (interpreter with numpy, pyarrow and tqdm
+                                loaded, measured at ~70MB), charged against the limit
+        """
+        if pa is None:
+            raise ImportError("pyarrow is required to write the similarity export")
+        self.output_dir = output_dir
+        self.k = k
+        self.workers = workers or os.cpu_count()
+        self.memory_limit = parse_size(memory_limit)
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.worker_overhead = parse_size(worker_overhead)
+
+    def plan(self, n: int, dim: int) -> Tuple[int, int]:
+        """
+        Pick block and chunk sizes so every worker stays within its share of the memory limit.
+
+        Per worker: the process baseline (``worker_overhead``), the query
+        block (b*d floats), one catalog chunk (c*d), the score matrix with its
+        argpartition temporaries (~16 bytes per entry of b*c) and the running top-k.
+        """
+        budget = self.memory_limit // self.workers - self.worker_overhead
+        block = self.block_size or min(n, 1024)
+        fixed = block * dim * 4 + block * self.k * 12 * 2
+        per_row = block * 16 + dim * 4
+        chunk = self.chunk_size or (budget - fixed) // per_row
+        if chunk < self.k + 1 or fixed + min(chunk, n) * per_row > budget:
+            raise ValueError(f"memory_limit of {self.memory_limit} bytes is too small for "
+                             f"{self.workers} workers with blocks of {block} rows "
+                             f"(each worker also needs {self.worker_overhead} bytes of process overhead)")
+        return block, int(min(chunk, n))
+
+    def prepare(self, vectors: np.ndarray, ids: np.ndarray) -> Tuple[str, str]:
+        """
+        Write L2-normalised float32 vectors and ids as .npy files workers can memory-map
+        """
+        vectors_path = os.path.join(self.output_dir, '_vectors.npy')
+        ids_path = os.path.join(self.output_dir, '_ids.npy')
+        if not os.path.exists(vectors_path):
+            out = np.lib.format.open_memmap(f'{vectors_path}.tmp.npy', mode='w+', dtype=np.float32,
+                                            shape=vectors.shape)
+            for start in range(0, len(vectors), 65536):
+                block = np.asarray(vectors[start:start + 65536], dtype=np.float32)
+                norms = np.linalg.norm(block, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                out[start:start + len(block)] = block / norms
+            out.flush()
+            del out
+            os.replace(f'{vectors_path}.tmp.npy', vectors_path)
+        if not os.path.exists(ids_path):
+            np.save(ids_path, np.asarray(ids))
+        return vectors_path, ids_path
+
+    def _check_manifest(self, manifest):
+        path = os.path.join(self.output_dir, '_manifest.json')
+        if os.path.exists(path):
+            with open(path) as file:
+                previous = json.load(file)
+            if previous != manifest:
+                raise ValueError(f"{self.output_dir} holds an export with different parameters "
+                                 f"({previous}), use a fresh output directory")
+        else:
+            with open(path, 'w') as file:
+                json.dump(manifest, file, indent=2)
+
+    def run(self, vectors: np.ndarray, ids: np.ndarray):
+        """
+        Export the top-k table, resuming from any parts already written
+
+        :param vectors: (n, d) embedding matrix, preferably a memmap so the parent stays small
+        :param ids: (n,) movie ids aligned with ``vectors``
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        n, dim = vectors.shape
+        block, chunk = self.plan(n, dim)
+        self._check_manifest({
+            'n': int(n),
+            'dim': int(dim),
+            'k': self.k,
+            'block_size': block,
+            'ids_sha256': hashlib.sha256(np.ascontiguousarray(ids).tobytes()).hexdigest(),
+        })
+        vectors_path, ids_path = self.prepare(vectors, ids)
+
+        tasks = []
+        for b, start in enumerate(range(0, n, block)):
+            path = os.path.join(self.output_dir, f'part-{b:06d}.parquet')
+            if not os.path.exists(path):
+                tasks.append((b, start, min(start + block, n), self.k, chunk, path))
+        n_blocks = -(-n // block)
+        print(f"{n_blocks - len(tasks)}/{n_blocks} parts already exported, "
+              f"{len(tasks)} to go (block={block}, chunk={chunk}, workers={self.workers})")
+
+        # One BLAS thread per worker; spawned children read these on import
+        saved = {var: os.environ.get(var) for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')}
+        os.environ.update({var: '1' for var in saved})
+        try:
+            ctx = mp.get_context('spawn')
+            with ctx.Pool(self.workers, initializer=_init_worker, initargs=(vectors_path, ids_path)) as pool:
+                with metrics.span('similarity_export.run'):
+                    for _ in tqdm(pool.imap_unordered(_export_block, tasks), total=len(tasks)):
+                        metrics.inc('mrs_export_parts_total')
+        finally:
+            for var, value in saved.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+
+        open(os.path.join(self.output_dir, '_SUCCESS'), 'w').close()
+        for path in (vectors_path, ids_path):
+            os.remove(path)
+
+
+def extract_npz_member(npz_path: str, name: str, out_path: str) -> str:
+    """
+    Stream one array of an .npz archive into a standalone .npy file, so it can
+    be memory-mapped instead of loaded
+    """
+    if not os.path.exists(out_path):
+        tmp = f'{out_path}.tmp'
+        with zipfile.ZipFile(npz_path) as archive, archive.open(f'{name}.npy') as src, open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 16 * 2 ** 20)
+        os.replace(tmp, out_path)
+    return out_path
+
+
+def load_matrix(args):
+    """
+    :return: (memory-mapped vectors, ids, extracted file to remove afterwards or None)
+    """
+    if args.index:
+        os.makedirs(args.output, exist_ok=True)
+        path = extract_npz_member(args.index, 'vectors', os.path.join(args.output, '_index_vectors.npy'))
+        with np.load(args.index, allow_pickle=False) as data:
+            ids = data['ids']
+        return np.load(path, mmap_mode='r'), ids, path
+    return np.load(args.vectors, mmap_mode='r'), np.load(args.ids), None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--index', help='Vector index saved by Recommender.from_local (.npz)')
+    source.add_argument('--vectors', help='(n, d) embedding matrix as .npy, used with --ids')
+    parser.add_argument('--ids', help='(n,) movie ids as .npy')
+    parser.add_argument('--output', required=True, help='Output directory for the Parquet parts')
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--memory-limit', default='8GB',
+                        help="Cap on the workers' combined memory, e.g. 48GB, including --worker-overhead "
+                             "per worker. The vectors are "
+                             "memory-mapped (--index is first extracted to disk), so the parent adds only "
+                             "the ids (8 bytes per movie) and one 65536-row block while preparing")
+    parser.add_argument('--worker-overhead', default='100MB',
+                        help='Baseline memory of one worker process (interpreter, numpy, pyarrow), '
+                             'subtracted from its share of --memory-limit')
+    parser.add_argument('--block-size', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.vectors and not args.ids:
+        parser.error('--vectors requires --ids')
+
+    vectors, ids, extracted = load_matrix(args)
+    SimilarityExporter(args.output, k=args.k, workers=args.workers, memory_limit=args.memory_limit,
+                       block_size=args.block_size, chunk_size=args.chunk_size,
+                       worker_overhead=args.worker_overhead).run(vectors, ids)
+    if extracted is not None:
+        del vectors
+        os.remove(extracted)
+
+
+if __name__ == '__main__':
+    main()
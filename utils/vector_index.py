@@ -0,0 +1,222 @@
+import os
+import numpy as np
+from utils import metrics
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class VectorIndex:
+    """
+    Exact cosine-similarity index over an in-memory embedding matrix.
+
+    Rows are L2-normalised once at construction so every search is a plain
+    matrix product followed by a partial sort.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: Sequence, block_size: int = 65536):
+        """
+        :param vectors: (n, d) embedding matrix, one row per catalog item
+        :param ids: Item ids (tmdb ids) aligned with the rows of ``vectors``
+        :param block_size: Number of index rows scored at once in max-sim searches
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("vectors must be a 2-D array with one row per id")
+
+        self.vectors = self.normalize(vectors)
+        self.ids = np.asarray(ids)
+        self.block_size = block_size
+        self._positions: Dict = {item_id: pos for pos, item_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32, copy=False)
+
+    def positions(self, ids: Iterable) -> np.ndarray:
+        """
+        Map item ids to row positions
+
+        :param ids: Item ids
+        :return: Array of row positions
+        """
+        try:
+            return np.array([self._positions[item_id] for item_id in ids], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"Id '{e.args[0]}' not found in indices")
+
+    @staticmethod
+    def top_k(scores: np.ndarray, k: int, exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Select the k best columns of each row of a score matrix
+
+        :param scores: (q, n) score matrix, modified in place when ``exclude`` is given
+        :param k: Number of results per row
+        :param exclude: Column positions masked out for every row
+        :return: (positions, scores), both of shape (q, k), best first
+        """
+        if exclude is not None and len(exclude):
+            scores[:, exclude] = -np.inf
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(scores.dtype)
+
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind='stable')
+        positions = np.take_along_axis(part, order, axis=1)
+        top_scores = np.take_along_axis(part_scores, order, axis=1)
+
+        # Drop masked columns that only surfaced because k exceeded the unmasked pool
+        if exclude is not None and len(exclude) and not np.isfinite(top_scores).all():
+            keep = np.isfinite(top_scores).all(axis=0)
+            positions, top_scores = positions[:, keep], top_scores[:, keep]
+        return positions, top_scores
+
+    def search(self, queries: np.ndarray, k: int,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k search for a batch of query vectors
+
+        :param queries: (q, d) or (d,) query vectors
+        :param k: Number of results per query
+        :param exclude: Row positions never returned
+        :return: (positions, scores), both of shape (q, k)
+        """
+        return self.top_k(self.scores(queries), k, exclude)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of a batch of query vectors against every item
+
+        :param queries: (q, d) or (d,) query vectors
+        :return: (q, n) score matrix
+        """
+        queries = self.normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        return queries @ self.vectors.T
+
+    def search_max_sim(self, queries: np.ndarray, k: int, weights: Optional[np.ndarray] = None,
+                       exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Multi-vector search scoring each item by its best (weighted) match
+        against any of the query vectors.
+
+        The index is scanned once in row blocks, so memory stays bounded by
+        ``len(queries) * block_size`` regardless of catalog size.
+
+        :param queries: (h, d) query vectors
+        :param k: Number of results
+        :param weights: Optional (h,) per-query weights
+        :param exclude: Row positions never returned
+        :return: (positions, scores), both of shape (k,)
+        """
+        queries = self.normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if weights is not None:
+            queries = queries * np.asarray(weights, dtype=np.float32)[:, None]
+
+        best = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            block = self.vectors[start:start + self.block_size]
+            np.max(queries @ block.T, axis=0, out=best[start:start + len(block)])
+
+        positions, scores = self.top_k(best[None, :], k, exclude)
+        return positions[0], scores[0]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], ids: Sequence, embeddings, batch_size: int = 256) -> 'VectorIndex':
+        """
+        Embed texts with a LangChain-compatible embedding model and index them
+
+        :param texts: Documents to embed (the movie soups)
+        :param ids: Item ids aligned with ``texts``
+        :param embeddings: Object exposing ``embed_documents``
+        :param batch_size: Number of texts embedded per call
+        """
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            with metrics.span('index.embed_documents'):
+                vectors.extend(embeddings.embed_documents(list(texts[i:i + batch_size])))
+        return cls(np.asarray(vectors, dtype=np.float32), ids)
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, vectors=self.vectors, ids=self.ids)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> 'VectorIndex':
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['vectors'], data['ids'], **kwargs)
+
+
+class IVFVectorIndex(VectorIndex):
+    """
+    Approximate index partitioning the catalog into ``nlist`` k-means cells;
+    a query only scores the rows of its ``nprobe`` closest cells.
+    """
+
+    def __init__(self, vectors: np.ndarray, ids: Sequence, nlist: Optional[int] = None, nprobe: int = 8,
+                 n_iter: int = 10, seed: int = 0, block_size: int = 65536):
+        """
+        :param nlist: Number of cells, defaults to ``4 * sqrt(n)``
+        :param nprobe: Number of cells scanned per query
+        :param n_iter: k-means iterations used to train the cells
+        :param seed: Seed of the k-means initialisation
+        """
+        super().__init__(vectors, ids, block_size=block_size)
+        self.nlist = min(nlist or max(1, int(4 * np.sqrt(len(self)))), len(self))
+        self.nprobe = nprobe
+        self.centroids = self._train(n_iter, seed)
+
+        assignment = self._assign(self.vectors)
+        self._order = np.argsort(assignment, kind='stable')
+        self._offsets = np.searchsorted(assignment[self._order], np.arange(self.nlist + 1))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), self.block_size):
+            block = vectors[start:start + self.block_size]
+            assignment[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignment
+
+    def _train(self, n_iter: int, seed: int) -> np.ndarray:
+        # Spherical k-means on a sample of at most 256 points per cell
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(self), 256 * self.nlist)
+        sample = self.vectors[rng.choice(len(self), sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, self.nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=self.nlist) == 0
+            sums[empty] = self.centroids[empty]
+            self.centroids = self.normalize(sums)
+        return self.centroids
+
+    def search(self, queries: np.ndarray, k: int,
+               exclude: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        queries = self.normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        nprobe = min(self.nprobe, self.nlist)
+        cells = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in cells[i]])
+            if exclude is not None and len(exclude):
+                candidates = candidates[~np.isin(candidates, exclude)]
+            top, top_scores = self.top_k((self.vectors[candidates] @ query)[None, :], k)
+            positions[i, :top.shape[1]] = candidates[top[0]]
+            scores[i, :top.shape[1]] = top_scores[0]
+
+        # Trim columns no query could fill
+        filled = (positions >= 0).any(axis=0)
+        return positions[:, filled], scores[:, filled]